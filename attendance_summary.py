@@ -0,0 +1,187 @@
+import argparse
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import text
+from bulk_loader import load_frame
+from point_in_time import as_of_join, date_ids_to_timestamps, student_versions_spec
+from reference_cache import read_reference, read_dates, quote
+from source_reader import read_chunks
+from update_history import ensure_update_history_columns, forget_high_water, last_high_water, record_high_water, max_pk
+from warehouse_db import engine
+
+# Pre-aggregated attendance for the dashboards, so they read summary rows instead of every mark.
+# Each refresh adds the counts of the fact Attendance rows past the high-water mark to the periods they
+# fall in. A stage that deletes attendance rows clears the mark, and the next refresh rebuilds in full.
+source_table = "fact Attendance"
+update_flag = "agg_attendance_summary"
+
+# Mark groups, from the codes in create attendance.py. Late still counts as present.
+present_marks = ["/", "L"]
+late_marks = ["L"]
+authorised_marks = ["I", "M", "H"]
+unauthorised_marks = ["N", "O"]
+measures = ["Possible marks", "Present marks", "Late marks", "Authorised absences", "Unauthorised absences",
+            "Minutes late"]
+
+# Key columns and their types, and the period key: a refresh rewrites every period that new rows touch
+summaries = {
+    "agg Attendance student week": {
+        "keys": {"Student warehouse bk": "INT", "Academic year": "VARCHAR(30)", "Week commencing pk": "BIGINT"},
+        "period": ["Week commencing pk"],
+    },
+    "agg Attendance group term": {
+        "keys": {"Teaching Group pk": "INT", "Academic year": "VARCHAR(30)", "Term": "VARCHAR(3)"},
+        "period": ["Academic year", "Term"],
+    },
+    "agg Attendance year group day": {
+        "keys": {"Year Group": "VARCHAR(10)", "Date pk": "BIGINT", "Academic year": "VARCHAR(30)"},
+        "period": ["Date pk"],
+    },
+}
+attendance_columns = ["Date pk", "Teaching Group pk", "Student warehouse bk", "Mark", "Minutes late"]
+attendance_dtypes = {"Date pk": "int64", "Student warehouse bk": "int32", "Mark": "category"}
+
+
+def ensure_summary_tables(engine):
+    inspector = sqlalchemy.inspect(engine)
+    with engine.begin() as conn:
+        for table, spec in summaries.items():
+            if inspector.has_table(table):
+                continue
+            columns = [f"{quote(conn, c)} {t} NOT NULL" for c, t in spec["keys"].items()]
+            columns += [f"{quote(conn, m)} BIGINT NOT NULL" for m in measures]
+            key_list = ", ".join(quote(conn, c) for c in spec["keys"])
+            conn.execute(text(f"CREATE TABLE {quote(conn, table)} ({', '.join(columns)}, PRIMARY KEY ({key_list}))"))
+            period_index = quote(conn, f"idx_{table.replace(' ', '_').lower()}_period")
+            conn.execute(text(f"CREATE INDEX {period_index} ON {quote(conn, table)} "
+                              f"({', '.join(quote(conn, c) for c in spec['period'])})"))
+
+
+# Academic year, term and week for every date id
+def date_keys():
+    dates = read_dates(engine)[["id", "Academic Year", "Term name", "Week commencing date"]]
+    week = pd.to_datetime(dates["Week commencing date"], errors="coerce")
+    return pd.DataFrame({
+        "Date pk": dates["id"].astype("int64"),
+        "Academic year": dates["Academic Year"],
+        "Term": dates["Term name"].astype(str),
+        "Week commencing pk": week.dt.strftime("%Y%m%d").fillna("0").astype("int64"),
+    })
+
+
+# Year group history of every student, looked up as of each mark's date
+def student_year_groups():
+    spec = student_versions_spec
+    students = read_reference(engine, spec["table"], [spec["key"], spec["effective"], spec["expiry"], "Year Group"])
+    return students.assign(**{"Year Group": students["Year Group"].astype(str)})
+
+
+# Counts for one chunk of attendance rows, per summary table
+def summarise_chunk(chunk, dates, students):
+    spec = student_versions_spec
+    df = chunk.merge(dates, on="Date pk", how="left")
+    df = as_of_join(df.assign(_date=date_ids_to_timestamps(df["Date pk"]).to_numpy()), students,
+                    "Student warehouse bk", "_date", spec["key"], spec["effective"], spec["expiry"], ["Year Group"])
+    df["Year Group"] = df["Year Group"].fillna("Unknown")
+    df["Academic year"] = df["Academic year"].fillna("Unspecified")
+    df["Term"] = df["Term"].fillna("")
+    df["Week commencing pk"] = df["Week commencing pk"].fillna(0).astype("int64")
+    # Registers without a teaching group are summed under group 0
+    df["Teaching Group pk"] = df["Teaching Group pk"].fillna(0).astype("int64")
+
+    marks = df["Mark"]
+    df["Possible marks"] = 1
+    df["Present marks"] = marks.isin(present_marks).astype("int64")
+    df["Late marks"] = marks.isin(late_marks).astype("int64")
+    df["Authorised absences"] = marks.isin(authorised_marks).astype("int64")
+    df["Unauthorised absences"] = marks.isin(unauthorised_marks).astype("int64")
+    df["Minutes late"] = df["Minutes late"].fillna(0).astype("int64")
+    return {
+        table: df.groupby(list(spec["keys"]), as_index=False, observed=True)[measures].sum()
+        for table, spec in summaries.items()
+    }
+
+
+# Summed counts of the attendance rows with last < pk <= high, read in chunks
+def summarise_rows(last, high):
+    dates, students = date_keys(), student_year_groups()
+    parts = {table: [] for table in summaries}
+    rows = 0
+    for chunk in read_chunks(source_table, attendance_columns, where="`pk` > :last AND `pk` <= :high",
+                             params={"last": int(last), "high": int(high)}, dtypes=attendance_dtypes):
+        rows += len(chunk)
+        for table, counts in summarise_chunk(chunk, dates, students).items():
+            parts[table].append(counts)
+    deltas = {}
+    for table, spec in summaries.items():
+        frames = parts[table] or [pd.DataFrame(columns=list(spec["keys"]) + measures)]
+        deltas[table] = pd.concat(frames, ignore_index=True).groupby(list(spec["keys"]), as_index=False)[measures].sum()
+    return deltas, rows
+
+
+# WHERE clause matching any of the given period key values
+def period_filter(conn, period, values):
+    params, rows = {}, []
+    # itertuples gives Python scalars, which every driver can bind
+    for i, row in enumerate(values[period].itertuples(index=False)):
+        names = [f"p{i}_{j}" for j in range(len(period))]
+        params.update(zip(names, row))
+        rows.append(", ".join(":" + n for n in names))
+    if len(period) == 1:
+        return f"{quote(conn, period[0])} IN ({', '.join(rows)})", params
+    return f"({', '.join(quote(conn, c) for c in period)}) IN ({', '.join(f'({r})' for r in rows)})", params
+
+
+# Stored rows of the periods the delta touches with the delta added, to be written back in their place.
+# The stored rows are deleted on conn.
+def merge_summary(conn, table, spec, delta, batch=500):
+    keys, period = list(spec["keys"]), spec["period"]
+    periods = delta[period].drop_duplicates()
+    merged = []
+    for start in range(0, len(periods), batch):
+        where, params = period_filter(conn, period, periods.iloc[start:start + batch])
+        existing = pd.read_sql(text(f"SELECT * FROM {quote(conn, table)} WHERE {where}"), conn, params=params)
+        part = delta.merge(periods.iloc[start:start + batch], on=period)
+        merged.append(pd.concat([existing, part], ignore_index=True).groupby(keys, as_index=False)[measures].sum())
+        conn.execute(text(f"DELETE FROM {quote(conn, table)} WHERE {where}"), params)
+    return pd.concat(merged, ignore_index=True)[keys + measures]
+
+
+# Bring the summary tables up to date with fact Attendance. Returns the number of attendance rows read.
+def refresh(full=False):
+    ensure_summary_tables(engine)
+    ensure_update_history_columns(engine, [update_flag])
+    high = max_pk(engine, source_table) or 0
+    last = None if full else last_high_water(engine, update_flag, source_table)
+    if last is None:
+        last = 0
+        full = True
+    deltas, rows = summarise_rows(last, high)
+
+    # The rows are written by the bulk loader, which commits as it goes, so the old mark is forgotten
+    # first and the new one only recorded once every table is written: a refresh that stops part way
+    # is redone in full.
+    with engine.begin() as conn:
+        forget_high_water(conn, source_table, update_flag)
+        writes = {}
+        for table, spec in summaries.items():
+            if full:
+                conn.execute(text(f"DELETE FROM {quote(conn, table)}"))
+                writes[table] = deltas[table]
+            elif not deltas[table].empty:
+                writes[table] = merge_summary(conn, table, spec, deltas[table])
+    for table, frame in writes.items():
+        load_frame(engine, table, frame)
+    with engine.begin() as conn:
+        record_high_water(conn, update_flag, source_table, high)
+
+    print(f"{'Rebuilt' if full else 'Updated'} attendance summaries from {rows} attendance rows "
+          f"({', '.join(f'{t}: {len(d)} rows' for t, d in deltas.items())}).")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the attendance summary tables from fact Attendance")
+    parser.add_argument("--full", action="store_true", help="rebuild the summaries from every attendance row")
+    args = parser.parse_args()
+    refresh(args.full)
@@ -0,0 +1,142 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Times each pipeline stage at several scale factors. Every stage runs in its own process so peak RSS
+# belongs to that stage alone; the generators already use fixed seeds, so runs are comparable.
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+# Default home of the results files, kept out of the working tree like the pipeline state
+results_dir = os.path.join(repo_dir, ".cache", "benchmarks")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Stages in an order that satisfies their dependencies
+def stage_order(names):
+    from pipeline import stages, with_dependencies
+    wanted = with_dependencies(names)
+    ordered = []
+    while len(ordered) < len(wanted):
+        for name in stages:
+            if name in wanted and name not in ordered and all(d in ordered for d in stages[name]["after"]):
+                ordered.append(name)
+    return ordered
+
+
+# Child process: run one stage in-process and report what it cost
+def measure_stage(name, scale_factor, result_file):
+    statements = {"count": 0}
+
+    # Every statement or executemany batch sent to the database is one round trip
+    @event.listens_for(Engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements["count"] += 1
+
+    from pipeline import run_stage
+    started = time.perf_counter()
+    result = run_stage(name, scale_factor, workers=1)
+    seconds = time.perf_counter() - started
+    with open(result_file, "w") as f:
+        json.dump({
+            "stage": name,
+            "scale_factor": scale_factor,
+            "seconds": round(seconds, 3),
+            "rows": result["rows"],
+            "rows_per_second": round(result["rows"] / seconds, 1) if seconds else None,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "sql_round_trips": statements["count"],
+        }, f)
+
+
+def run_benchmarks(url, scale_factors, names, template=None):
+    results = []
+    for scale_factor in scale_factors:
+        with tempfile.TemporaryDirectory() as scratch:
+            env = dict(os.environ, WAREHOUSE_CACHE_DIR=os.path.join(scratch, "cache"))
+            if url:
+                env["WAREHOUSE_URL"] = url
+            if template:
+                # Start every scale factor from the same SQLite file
+                database = os.path.join(scratch, "warehouse.db")
+                shutil.copyfile(template, database)
+                env["WAREHOUSE_URL"] = f"sqlite:///{database}"
+
+            for name in stage_order(names):
+                result_file = os.path.join(scratch, f"{name}.json")
+                print(f"Scale factor {scale_factor}: {name}...")
+                subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", name,
+                                "--scale-factors", str(scale_factor), "--output", result_file],
+                               cwd=repo_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+                with open(result_file) as f:
+                    results.append(json.load(f))
+                print("  {seconds}s, {rows} rows, {peak_rss_mb} MB peak, {sql_round_trips} round trips".format(**results[-1]))
+    return results
+
+
+# Print each stage's time against an earlier results file
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = {(r["stage"], r["scale_factor"]): r for r in json.load(f)["results"]}
+    print(f"{'stage':<16}{'SF':>6}{'before':>10}{'after':>10}{'change':>10}")
+    for r in results:
+        before = baseline.get((r["stage"], r["scale_factor"]))
+        if before and before["seconds"]:
+            change = (r["seconds"] - before["seconds"]) / before["seconds"]
+            print(f"{r['stage']:<16}{r['scale_factor']:>6}{before['seconds']:>10}{r['seconds']:>10}{change:>+10.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the generator stages at several scale factors")
+    parser.add_argument("--scale-factors", type=float, nargs="+", default=[0.25, 0.5, 1.0])
+    parser.add_argument("--stages", nargs="+", help="stages to time (and what they depend on); default all")
+    parser.add_argument("--url", default=os.environ.get("WAREHOUSE_URL"),
+                        help="database to run against; it should start empty, as after Initial database.sql")
+    parser.add_argument("--template", help="SQLite file loaded with Initial database.sql, copied for each scale factor")
+    parser.add_argument("--output", help="results file (default .cache/benchmarks/benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure_stage(args.measure, args.scale_factors[0], args.output)
+        raise SystemExit(0)
+
+    from pipeline import stages
+    names = args.stages or [n for n, s in stages.items() if not s.get("optional")]
+    if not args.template and len(args.scale_factors) > 1:
+        print("Without --template every scale factor writes into the same database; "
+              "reload Initial database.sql between runs for clean numbers.")
+
+    commit = git_commit()
+    results = run_benchmarks(args.url, args.scale_factors, names, args.template)
+    output = args.output or os.path.join(results_dir, f"benchmark-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "results": results,
+        }, f, indent=2)
+    print(f"Saved {len(results)} results to {output}")
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,234 @@
+import csv
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from scale import school_bk_range
+from update_history import ensure_update_history_columns, forget_high_water
+
+# Rows per multi-row INSERT round trip
+default_batch_size = 5000
+
+# Parameter marker for each DB-API paramstyle; numbered styles get the column position
+placeholders = {"qmark": "?", "format": "%s", "pyformat": "%s", "numeric_dollar": "${}"}
+
+
+# Python values the DB drivers understand, with NaN/NaT as None
+def chunk_to_rows(df):
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+# Split a DataFrame into fixed-size pieces so it can be streamed
+def iter_frame_chunks(df, chunk_size=50_000):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+# LOAD DATA LOCAL INFILE needs the client flag (local_infile=True in connect_args) and the server switch
+def local_infile_available(conn):
+    if conn.dialect.name not in ("mysql", "mariadb"):
+        return False
+    client_flag = getattr(conn.connection.dbapi_connection, "client_flag", 0)
+    if not client_flag & 128:  # CLIENT.LOCAL_FILES
+        return False
+    row = conn.execute(text("SHOW VARIABLES LIKE 'local_infile'")).fetchone()
+    return row is not None and str(row[1]).upper() == "ON"
+
+
+def insert_chunk(conn, table, df, batch_size=default_batch_size):
+    quote = conn.dialect.identifier_preparer.quote
+    marker = placeholders[conn.dialect.paramstyle]
+    sql = (
+        f"INSERT INTO {quote(table)} ({', '.join(quote(c) for c in df.columns)}) "
+        f"VALUES ({', '.join(marker.format(i + 1) for i in range(len(df.columns)))})"
+    )
+    rows = chunk_to_rows(df)
+    # PyMySQL rewrites executemany on INSERT ... VALUES into multi-row statements
+    for start in range(0, len(rows), batch_size):
+        conn.exec_driver_sql(sql, rows[start:start + batch_size])
+
+
+def load_data_chunk(conn, table, df):
+    quote = conn.dialect.identifier_preparer.quote
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            df.to_csv(f, sep="\t", header=False, index=False, na_rep="NULL",
+                      quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+        conn.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote(table)} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            "LINES TERMINATED BY '\\n' "
+            f"({', '.join(quote(c) for c in df.columns)})"
+        )
+    finally:
+        os.remove(path)
+
+
+# DuckDB scans the DataFrame in place, with no parameter binding at all
+def duckdb_chunk(conn, table, df):
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(c) for c in df.columns)
+    duckdb_conn = conn.connection.dbapi_connection
+    duckdb_conn.register("bulk_loader_chunk", df)
+    try:
+        conn.exec_driver_sql(f"INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM bulk_loader_chunk")
+    finally:
+        duckdb_conn.unregister("bulk_loader_chunk")
+
+
+# Writer threads load_chunks inserts with while the caller's thread generates the next chunks.
+# WAREHOUSE_WRITERS=0 goes back to generating and inserting in turn on one thread.
+default_writers = int(os.environ.get("WAREHOUSE_WRITERS", 2))
+
+
+def is_mysql(conn):
+    return conn.dialect.name in ("mysql", "mariadb")
+
+
+# Insert one chunk the fastest way the connection allows and commit it
+def write_chunk(conn, table, df, batch_size, use_load_data):
+    if use_load_data:
+        load_data_chunk(conn, table, df)
+    elif conn.dialect.name == "duckdb":
+        duckdb_chunk(conn, table, df)
+    else:
+        insert_chunk(conn, table, df, batch_size)
+    conn.commit()
+    return len(df)
+
+
+# A connection for loading: on MariaDB, unique and foreign key checks are off until it is returned
+@contextmanager
+def loading_connection(engine):
+    with engine.connect() as conn:
+        if is_mysql(conn):
+            conn.exec_driver_sql("SET unique_checks = 0, foreign_key_checks = 0")
+        try:
+            yield conn
+        finally:
+            if is_mysql(conn):
+                conn.exec_driver_sql("SET unique_checks = 1, foreign_key_checks = 1")
+                conn.commit()
+
+
+# On MariaDB, non-unique indexes are not maintained while the table loads, and are rebuilt once at the end
+@contextmanager
+def keys_disabled(engine, table):
+    if not is_mysql(engine):
+        yield
+        return
+    with engine.connect() as conn:
+        quoted_table = conn.dialect.identifier_preparer.quote(table)
+        conn.exec_driver_sql(f"ALTER TABLE {quoted_table} DISABLE KEYS")
+        try:
+            yield
+        finally:
+            conn.exec_driver_sql(f"ALTER TABLE {quoted_table} ENABLE KEYS")
+            conn.commit()
+
+
+# One writer thread: insert chunks from the queue over its own connection until it takes None. After
+# a failure it keeps taking chunks without writing them, so the producer never blocks on a full queue.
+def chunk_writer(engine, table, chunk_queue, failed, batch_size, use_load_data):
+    total, error, finished = 0, None, False
+    try:
+        with loading_connection(engine) as conn:
+            use_load_data = use_load_data and local_infile_available(conn)
+            while (df := chunk_queue.get()) is not None:
+                if not failed.is_set():
+                    total += write_chunk(conn, table, df, batch_size, use_load_data)
+            finished = True
+    except Exception as e:
+        # Whatever failed, even opening the connection, tell the producer and keep taking chunks
+        # until the end marker, so it never waits on a queue nobody reads
+        error = e
+        failed.set()
+        while not finished:
+            finished = chunk_queue.get() is None
+    if error is not None:
+        raise error
+    return total
+
+
+# Put item on the queue, retrying every `timeout` seconds until it fits or stop() says to give up
+def offer(chunk_queue, item, stop, timeout=0.1):
+    while not stop():
+        try:
+            chunk_queue.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# Generate chunks on this thread while `writers` threads insert the earlier ones, each over its own
+# pooled connection. The queue holds at most queue_size chunks, so a slow database holds the generator
+# back instead of letting chunks pile up in memory. Generation stops once a writer fails or exits.
+def load_overlapped(engine, table, chunks, batch_size, use_load_data, writers, queue_size=None):
+    chunk_queue = queue.Queue(maxsize=queue_size or 2 * writers)
+    failed = threading.Event()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        futures = [executor.submit(chunk_writer, engine, table, chunk_queue, failed, batch_size, use_load_data)
+                   for _ in range(writers)]
+        stopped = lambda: failed.is_set() or any(future.done() for future in futures)
+        try:
+            for df in chunks:
+                if df is not None and not df.empty and not offer(chunk_queue, df, stopped):
+                    break
+        finally:
+            for _ in futures:
+                offer(chunk_queue, None, lambda: all(future.done() for future in futures))
+        return sum(future.result() for future in futures)
+
+
+# Stream an iterable of DataFrame chunks into a table, committing per chunk so memory stays bounded.
+# With writers, chunks are inserted while the next ones are generated; SQLite takes one writer at a time,
+# so there it gets one. On MariaDB, key and unique checks are switched off for the duration of the load.
+def load_chunks(engine, table, chunks, batch_size=default_batch_size, use_load_data=True, writers=None):
+    writers = default_writers if writers is None else writers
+    if engine.dialect.name == "sqlite":
+        writers = min(writers, 1)
+    started = time.perf_counter()
+
+    with keys_disabled(engine, table):
+        if writers > 0:
+            total = load_overlapped(engine, table, chunks, batch_size, use_load_data, writers)
+        else:
+            total = 0
+            with loading_connection(engine) as conn:
+                use_load_data = use_load_data and local_infile_available(conn)
+                for df in chunks:
+                    if df is not None and not df.empty:
+                        total += write_chunk(conn, table, df, batch_size, use_load_data)
+
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {total} rows into {table} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return total
+
+
+# Convenience wrapper for code that still builds a whole DataFrame
+def load_frame(engine, table, df, chunk_size=50_000, **kwargs):
+    return load_chunks(engine, table, iter_frame_chunks(df, chunk_size), **kwargs)
+
+
+# Remove the rows a stage is about to write again for one school, so a re-run replaces them instead of
+# adding a second copy. Schools own disjoint BK ranges, so bk_column picks out the school's rows; where
+# narrows them to what the stage writes, e.g. one academic year. Summaries kept up to date from the table
+# by high-water mark are rebuilt in full on their next refresh.
+def delete_school_rows(engine, table, bk_column, school, where=None, params=None):
+    lo, hi = school_bk_range(school)
+    ensure_update_history_columns(engine)
+    with engine.begin() as conn:
+        quote = conn.dialect.identifier_preparer.quote
+        clause = f"{quote(bk_column)} BETWEEN :lo AND :hi" + (f" AND ({where})" if where else "")
+        result = conn.execute(text(f"DELETE FROM {quote(table)} WHERE {clause}"), {"lo": lo, "hi": hi, **(params or {})})
+        if result.rowcount:
+            forget_high_water(conn, table)
+    return result.rowcount
@@ -0,0 +1,162 @@
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from scd2_merge import dimensions
+from source_reader import read_frame
+from warehouse_db import engine as default_engine
+
+# Checks run after a load: every reference points at a row that exists, keys that must be unique are,
+# and no key has two versions of a type 2 dimension valid on the same day. Only the key columns are
+# read, a table at a time, and compared in memory with hashed isin and duplicated.
+
+# Column of a table whose values must all be in the key column of another
+foreign_keys = [
+    ("fact student class enrolement", "Teaching group ID", "dim Teaching Groups", "pk"),
+    ("fact student class enrolement", "Student ID", "dim_students_isams", "id"),
+    ("fact student class enrolement", "Student warehouse BK", "dim_people", "person_bk"),
+    ("fact Attendance", "Date pk", "dim_Dates", "id"),
+    ("fact Attendance", "Teaching Group pk", "dim Teaching Groups", "pk"),
+    ("fact Attendance", "Student pk", "dim_students_isams", "id"),
+    ("fact Attendance", "Student warehouse bk", "dim_people", "person_bk"),
+    ("fact Attendance", "Class teacher warehouse BK", "dim Staff", "Warehouse PK"),
+    ("fact_report", "Student", "dim_people", "person_bk"),
+    ("fact_report", "Teaching group pk", "dim Teaching Groups", "pk"),
+    ("fact_report", "Result pk", "dim_report_grade", "id"),
+    ("fact Behaviour", "Student", "dim_people", "person_bk"),
+    ("fact Behaviour", "Recording teacher Warehouse BK", "dim Staff", "Warehouse PK"),
+    ("dim_students_isams", "Person BK", "dim_people", "person_bk"),
+    ("dim Staff", "Warehouse PK", "dim_people", "person_bk"),
+    ("dim Teaching Groups", "Teacher", "dim Staff", "Warehouse PK"),
+]
+
+# Columns whose values, together, must not repeat in a table
+unique_keys = [
+    ("dim_people", ["person_bk"]),
+    ("dim_people", ["gis_id"]),
+    ("dim_people", ["sims_pk"]),
+    ("dim_people", ["isams_school_id"]),
+    ("dim_people", ["isams_user_code"]),
+    ("fact student class enrolement", ["Student ID", "Teaching group ID"]),
+]
+
+# Failing values listed per check
+sample_size = 5
+
+
+# Every key column the checks on existing tables need, read with one query per table. Checks on a
+# table that does not exist, or that points at one, are left out.
+def read_keys(engine=default_engine):
+    tables = set(sqlalchemy.inspect(engine).get_table_names())
+    needed = {}
+    for table, column, reference, key in foreign_keys:
+        if table in tables and reference in tables:
+            needed.setdefault(table, set()).add(column)
+            needed.setdefault(reference, set()).add(key)
+    for table, columns in unique_keys:
+        if table in tables:
+            needed.setdefault(table, set()).update(columns)
+    for table, spec in dimensions.items():
+        if table in tables:
+            needed.setdefault(table, set()).update([spec["key"], spec["effective"], spec["expiry"]])
+    return {table: read_frame(table, sorted(columns), engine=engine) for table, columns in needed.items()}
+
+
+def finding(check, table, columns, rows, failed, reference=None, seconds=0.0):
+    values = pd.Series(failed).drop_duplicates().head(sample_size)
+    return {
+        "check": check, "table": table, "columns": columns, "reference": reference, "rows": int(rows),
+        "failures": int(len(failed)), "sample": [v.item() if hasattr(v, "item") else v for v in values],
+        "seconds": round(seconds, 3),
+    }
+
+
+# Values of table.column, missing values aside, that are not in reference.key
+def check_orphans(keys, table, column, reference, key):
+    started = time.perf_counter()
+    values = keys[table][column].dropna()
+    known = keys[reference][key].dropna().unique()
+    orphans = values[~values.isin(known)]
+    return finding("orphans", table, [column], len(values), orphans, f"{reference}.{key}", time.perf_counter() - started)
+
+
+# Rows whose `columns` repeat those of another row; every copy counts
+def check_duplicates(keys, table, columns):
+    started = time.perf_counter()
+    frame = keys[table][columns]
+    repeated = frame[frame.duplicated(keep=False)]
+    failed = repeated[columns[0]] if len(columns) == 1 else repeated.apply(tuple, axis=1)
+    return finding("duplicates", table, columns, len(frame), failed, seconds=time.perf_counter() - started)
+
+
+# Versions that start on or before the previous version of the same key ends. Both ends of a range are
+# inclusive and a missing expiry is open, as in point_in_time.as_of_join.
+def check_overlaps(keys, table, spec):
+    started = time.perf_counter()
+    frame = keys[table][[spec["key"], spec["effective"], spec["expiry"]]]
+    frame = frame.assign(
+        _effective=pd.to_datetime(frame[spec["effective"]], errors="coerce"),
+        _expiry=pd.to_datetime(frame[spec["expiry"]], errors="coerce"),
+    ).sort_values([spec["key"], "_effective"], kind="stable")
+    key = frame[spec["key"]].to_numpy()
+    effective, expiry = frame["_effective"].to_numpy(), frame["_expiry"].to_numpy()
+    same_key = key[1:] == key[:-1]
+    open_before = np.isnat(expiry[:-1])
+    overlap = same_key & (open_before | (effective[1:] <= expiry[:-1]))
+    failed = key[1:][overlap]
+    return finding("scd overlaps", table, [spec["key"], spec["effective"], spec["expiry"]], len(frame), failed,
+                   seconds=time.perf_counter() - started)
+
+
+# Every check whose tables exist, as findings with the failure count and a sample of failing values
+def run_checks(engine=default_engine):
+    started = time.perf_counter()
+    keys = read_keys(engine)
+    print(f"Read the key columns of {len(keys)} tables in {time.perf_counter() - started:.1f}s")
+    results = []
+    for table, column, reference, key in foreign_keys:
+        if table in keys and reference in keys:
+            results.append(check_orphans(keys, table, column, reference, key))
+    for table, columns in unique_keys:
+        if table in keys:
+            results.append(check_duplicates(keys, table, columns))
+    for table, spec in dimensions.items():
+        if table in keys:
+            results.append(check_overlaps(keys, table, spec))
+    return results
+
+
+def print_summary(results):
+    print(f"{'check':<14}{'table':<32}{'columns':<34}{'rows':>10}{'failures':>10}{'seconds':>9}  sample")
+    for r in results:
+        columns = ", ".join(r["columns"]) + (f" -> {r['reference']}" if r["reference"] else "")
+        sample = ", ".join(str(v) for v in r["sample"]) if r["failures"] else ""
+        print(f"{r['check']:<14}{r['table']:<32}{columns[:33]:<34}{r['rows']:>10}{r['failures']:>10}"
+              f"{r['seconds']:>9}  {sample}")
+    failed = [r for r in results if r["failures"]]
+    print(f"{len(results) - len(failed)} of {len(results)} checks passed.")
+
+
+# Pipeline stage: fails the run when any check finds something
+def validate():
+    results = run_checks()
+    print_summary(results)
+    failed = [r for r in results if r["failures"]]
+    if failed:
+        raise ValueError(f"{len(failed)} data quality checks failed: "
+                         + "; ".join(f"{r['check']} in {r['table']}" for r in failed))
+    return sum(r["rows"] for r in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check referential integrity and keys after a load")
+    parser.add_argument("--json", help="also write the findings to this file")
+    args = parser.parse_args()
+    results = run_checks()
+    print_summary(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+    raise SystemExit(1 if any(r["failures"] for r in results) else 0)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+# Parameters
+min_students = 8
+max_students = 24
+
+
+# Extract year from class codes (e.g., 9A/Ph1 → 9)
+def extract_year(codes):
+    return codes.str.extract(r"^(\d{1,2})[A-Z]/", expand=False)
+
+
+# Fill every class in one pass. Availability is a (subject × student) boolean mask, and students are
+# sorted by year group so each class only looks at a contiguous slice of its own year's columns.
+def allocate_enrolments(students_df, classes_df, min_students=min_students, max_students=max_students,
+                        seed=42, effective_date=None):
+    rng = np.random.default_rng(seed)
+    effective_date = effective_date or date.today()
+
+    students = students_df.assign(**{"Year Group": students_df["Year Group"].astype(str).str.strip()})
+    students = students.sort_values("Year Group", kind="stable").reset_index(drop=True)
+    year_codes, year_index = np.unique(students["Year Group"].to_numpy(), return_inverse=True)
+    year_bounds = np.searchsorted(year_index, np.arange(len(year_codes) + 1))
+    year_lookup = {y: i for i, y in enumerate(year_codes)}
+
+    classes = classes_df
+    if "Year Group" not in classes.columns:
+        classes = classes.assign(**{"Year Group": extract_year(classes["Class code"])})
+    subject_codes, subject_index = np.unique(classes["Subject name"].astype(str).to_numpy(), return_inverse=True)
+
+    available = np.ones((len(subject_codes), len(students)), dtype=bool)
+    class_sizes = rng.integers(min_students, max_students + 1, len(classes))
+    picked_students, picked_classes = [], []
+
+    for c, (year, subject) in enumerate(zip(classes["Year Group"].to_numpy(), subject_index)):
+        y = year_lookup.get(year)
+        if y is None:
+            continue
+        lo, hi = year_bounds[y], year_bounds[y + 1]
+        eligible = lo + np.flatnonzero(available[subject, lo:hi])
+        if not len(eligible):
+            continue
+
+        chosen = rng.choice(eligible, size=min(len(eligible), class_sizes[c]), replace=False)
+        available[subject, chosen] = False
+        picked_students.append(chosen)
+        picked_classes.append(np.full(len(chosen), c))
+
+    if not picked_students:
+        picked_students, picked_classes = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+    s = np.concatenate(picked_students)
+    c = np.concatenate(picked_classes)
+
+    return pd.DataFrame({
+        "Student ID": students["id"].to_numpy()[s],
+        "Student warehouse BK": students["Person BK"].to_numpy()[s],
+        "Teaching group ID": classes["pk"].to_numpy()[c],
+        "Row effective date": effective_date,
+        "Row expiry date": None,
+        "Academic year": classes["Academic year"].to_numpy()[c],
+    })
@@ -0,0 +1,227 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import inspect, text
+from reference_cache import read_dates, quote
+from warehouse_db import engine
+
+# Fact tables exported for notebooks, as Parquet partitioned by academic year and term. Tables keyed
+# on a date id get their year and term from dim_Dates; fact_report carries its own.
+export_dir = os.environ.get(
+    "WAREHOUSE_EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "export")
+)
+export_tables = {
+    "fact Attendance": {"date_column": "Date pk"},
+    "fact_report": {"year_column": "Academic year", "term_column": "Term"},
+    "fact Behaviour": {"date_column": "Date recorded"},
+}
+partitioning = ds.partitioning(pa.schema([("academic_year", pa.string()), ("term", pa.string())]), flavor="hive")
+manifest_name = "_manifest.json"
+
+
+def table_dir(table, output=export_dir):
+    return os.path.join(output, table.replace(" ", "_"))
+
+
+def partition_dir(table, year, term, output=export_dir):
+    return os.path.join(table_dir(table, output), f"academic_year={year}", f"term={term}")
+
+
+# Arrow types from the database column types, so every chunk and every run writes the same schema.
+# Strings are dictionary encoded: most of them repeat a handful of values. TIME columns are times of
+# day, which the MariaDB driver hands over as timedelta.
+def arrow_schema(engine, table, skip=()):
+    fields = []
+    for col in inspect(engine).get_columns(table):
+        if col["name"] in skip:
+            continue
+        try:
+            kind = col["type"].python_type
+        except NotImplementedError:
+            kind = str
+        if kind is bool:
+            arrow_type = pa.bool_()
+        elif kind is int:
+            arrow_type = pa.int64()
+        elif kind in (float,) or kind.__name__ == "Decimal":
+            arrow_type = pa.float64()
+        elif kind is datetime.datetime:
+            arrow_type = pa.timestamp("us")
+        elif kind is datetime.date:
+            arrow_type = pa.date32()
+        elif kind in (datetime.time, datetime.timedelta):
+            arrow_type = pa.time64("us")
+        else:
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(col["name"], arrow_type))
+    return pa.schema(fields)
+
+
+def to_arrow(df, schema):
+    columns = []
+    for field in schema:
+        values = df[field.name]
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(values, from_pandas=True)
+            if not pa.types.is_string(array.type):
+                array = array.cast(pa.string())
+            columns.append(pc.dictionary_encode(array))
+        elif pa.types.is_date32(field.type) or pa.types.is_timestamp(field.type):
+            columns.append(pa.array(pd.to_datetime(values, errors="coerce"), type=pa.timestamp("us")).cast(field.type))
+        elif pa.types.is_time(field.type):
+            # timedelta from MariaDB, time objects or "HH:MM:SS" strings from the embedded backends
+            deltas = values if pd.api.types.is_timedelta64_dtype(values) else pd.to_timedelta(values.astype("string"), errors="coerce")
+            micros = deltas // pd.Timedelta(microseconds=1)
+            columns.append(pa.array(micros, type=pa.int64(), from_pandas=True).cast(field.type))
+        else:
+            columns.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+# (academic year, term) -> the last day and the date ids in it
+def term_calendar():
+    dates = read_dates(engine)[["id", "Date", "Academic Year", "Term name"]]
+    dates = dates.rename(columns={"Academic Year": "academic_year", "Term name": "term"})
+    dates["term"] = dates["term"].astype(str)
+    return dates
+
+
+# Partitions whose last day has passed cannot gain rows, so once exported they are never read again
+def closed_partitions(calendar, today=None):
+    today = pd.Timestamp(today or datetime.date.today())
+    last_day = calendar.groupby(["academic_year", "term"])["Date"].max()
+    return {f"{y}/{t}" for (y, t), day in last_day.items() if day < today}
+
+
+# Contiguous runs of date ids (in dim_Dates order) that are all in `excluded`, as (first, last) pairs
+def id_runs(all_ids, excluded):
+    ids = pd.Series(sorted(all_ids))
+    mask = ids.isin(excluded)
+    run = (mask != mask.shift()).cumsum()
+    return [(int(g.iloc[0]), int(g.iloc[-1])) for _, g in ids[mask].groupby(run[mask])]
+
+
+# WHERE clause and parameters that skip partitions already exported and closed
+def skip_clause(table, done, calendar):
+    spec = export_tables[table]
+    clauses, params = [], {}
+    if "date_column" in spec:
+        in_done = (calendar["academic_year"] + "/" + calendar["term"]).isin(done)
+        for i, (lo, hi) in enumerate(id_runs(calendar["id"], set(calendar.loc[in_done, "id"]))):
+            clauses.append(f"{quote(engine, spec['date_column'])} NOT BETWEEN :lo{i} AND :hi{i}")
+            params[f"lo{i}"], params[f"hi{i}"] = lo, hi
+    else:
+        for i, key in enumerate(sorted(done)):
+            year, term = key.split("/", 1)
+            clauses.append(f"NOT ({quote(engine, spec['year_column'])} = :y{i} AND {quote(engine, spec['term_column'])} = :t{i})")
+            params[f"y{i}"], params[f"t{i}"] = year, term
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def load_manifest(table, output=export_dir):
+    path = os.path.join(table_dir(table, output), manifest_name)
+    if not os.path.exists(path):
+        return {"table": table, "partitions": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, table, output=export_dir):
+    path = os.path.join(table_dir(table, output), manifest_name)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+# Stream one fact table through a server-side cursor into per-partition Parquet files. Partitions that
+# were exported after they closed are skipped; every other partition is rewritten in full.
+def export_table(table, output=export_dir, full=False, chunk_size=100_000, today=None):
+    spec = export_tables[table]
+    calendar = term_calendar()
+    manifest = {"table": table, "partitions": {}} if full else load_manifest(table, output)
+    closed = closed_partitions(calendar, today)
+    done = {key for key, p in manifest["partitions"].items() if p["closed"] and key in closed}
+
+    partition_columns = [spec["year_column"], spec["term_column"]] if "year_column" in spec else []
+    schema = arrow_schema(engine, table, skip=partition_columns)
+    where, params = skip_clause(table, done, calendar)
+    staging = os.path.join(table_dir(table, output), f".staging-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    writers, rows = {}, {}
+    sql = text(f"SELECT * FROM {quote(engine, table)}{where}")
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+        for chunk in pd.read_sql(sql, conn, params=params, chunksize=chunk_size):
+            if "date_column" in spec:
+                keys = chunk[[spec["date_column"]]].merge(
+                    calendar[["id", "academic_year", "term"]], left_on=spec["date_column"], right_on="id", how="left"
+                )
+                years = keys["academic_year"].fillna("Unknown").to_numpy()
+                terms = keys["term"].fillna("Unknown").to_numpy()
+            else:
+                years = chunk[spec["year_column"]].fillna("Unknown").astype(str).to_numpy()
+                terms = chunk[spec["term_column"]].fillna("Unknown").astype(str).to_numpy()
+
+            for (year, term), part in chunk.groupby([years, terms], sort=False):
+                key = f"{year}/{term}"
+                if key not in writers:
+                    path = partition_dir(table, year, term, staging)
+                    os.makedirs(path, exist_ok=True)
+                    writers[key] = pq.ParquetWriter(os.path.join(path, "part-0.parquet"), schema, use_dictionary=True)
+                    rows[key] = 0
+                writers[key].write_table(to_arrow(part, schema))
+                rows[key] += len(part)
+
+    for writer in writers.values():
+        writer.close()
+
+    # Swap the new partitions in, and drop partitions in scope that no longer have rows
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    for key in set(manifest["partitions"]) - done - set(writers):
+        shutil.rmtree(partition_dir(table, *key.split("/", 1), output), ignore_errors=True)
+        del manifest["partitions"][key]
+    for key in writers:
+        target = partition_dir(table, *key.split("/", 1), output)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(partition_dir(table, *key.split("/", 1), staging), target)
+        manifest["partitions"][key] = {"rows": rows[key], "closed": key in closed, "exported_at": now}
+    shutil.rmtree(staging, ignore_errors=True)
+    save_manifest(manifest, table, output)
+    return rows
+
+
+# Read an export back, optionally only some academic years / terms, e.g.
+# read_export("fact_report", academic_year="2025-2026", term=["1.1", "1.2"])
+def read_export(table, output=export_dir, columns=None, **partition_values):
+    dataset = ds.dataset(table_dir(table, output), format="parquet", partitioning=partitioning,
+                         exclude_invalid_files=True)
+    expression = None
+    for name, value in partition_values.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        condition = ds.field(name).isin([str(v) for v in values])
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export fact tables to Parquet partitioned by academic year and term")
+    parser.add_argument("tables", nargs="*", help=f"tables to export (default all): {', '.join(export_tables)}")
+    parser.add_argument("--output", default=export_dir)
+    parser.add_argument("--full", action="store_true", help="re-export every partition, not only open or new ones")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(export_tables)
+    if unknown:
+        parser.error(f"not an exported table: {', '.join(sorted(unknown))}")
+
+    for table in args.tables or list(export_tables):
+        rows = export_table(table, args.output, args.full, args.chunk_size)
+        print(f"{table}: wrote {sum(rows.values())} rows in {len(rows)} partitions to {table_dir(table, args.output)}")
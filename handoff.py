@@ -0,0 +1,55 @@
+import pandas as pd
+from reference_cache import read_reference
+from scale import school_bk_range
+from scd2_merge import dimensions
+from source_reader import read_frame
+
+# Frames the generator stages pass on when pipeline.py --in-memory runs every stage of a school in
+# one process. Each stage still writes its table once, then keeps what it wrote here, so later stages
+# take the rows from memory instead of reading them back. Outside such a run nothing is kept and every
+# lookup falls through to the database, which is also what happens for stages finished in earlier runs.
+enabled = False
+frames = {}
+
+
+def keep(table, school, frame):
+    if enabled:
+        frames[(table, school)] = frame
+    return frame
+
+
+# What an earlier stage kept for this school's rows of `table`, or None
+def kept(table, school):
+    return frames.get((table, school))
+
+
+def clear(school):
+    for key in [k for k in frames if k[1] == school]:
+        del frames[key]
+
+
+# One school's rows of a reference table, from memory when an earlier stage kept them and otherwise
+# from read_reference, cut down to the school's BK range on `bk_column`. With as_of, a type 2 dimension
+# read from the database is cut down to the versions current on that day too, as kept frames only hold
+# current versions.
+def school_rows(engine, table, school, bk_column, columns=None, as_of=None):
+    frame = kept(table, school)
+    if frame is None:
+        lo, hi = school_bk_range(school)
+        expiry = dimensions[table]["expiry"] if as_of is not None and table in dimensions else None
+        needed = list(dict.fromkeys(columns + [bk_column] + ([expiry] if expiry else []))) if columns else None
+        frame = read_reference(engine, table, needed)
+        rows = frame[bk_column].between(lo, hi)
+        if expiry:
+            expires = pd.to_datetime(frame[expiry], errors="coerce")
+            rows &= expires.isna() | (expires > pd.Timestamp(as_of))
+        frame = frame[rows]
+    return frame[columns] if columns else frame
+
+
+# Attach the keys the database assigned to rows that were just inserted, read in one narrow query on
+# the natural key columns `on`. When a natural key matches several rows, the highest key wins.
+def with_keys(engine, table, frame, keys, on, where, params=None):
+    fetched = read_frame(table, keys + on, where=where, params=params, order_by=keys[:1], engine=engine)
+    fetched = fetched.drop_duplicates(on, keep="last")
+    return frame.drop(columns=keys, errors="ignore").merge(fetched, on=on)
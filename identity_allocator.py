@@ -0,0 +1,86 @@
+import hashlib
+import numpy as np
+from scale import person_bk_block
+
+# Unique IDs without pools: the n-th person of an ID space gets the n-th value of a keyed permutation
+# of that space. Any ID is computed from its ordinal alone, so nothing is held per ID already handed
+# out, and every worker computes the same IDs from the same seed without talking to the others.
+feistel_rounds = 4
+
+# Source-system IDs, each a permutation of one range shared by every school
+global_id_ranges = {
+    "gis_id": (1_000_000, 9_999_999),
+    "sims_pk": (2_000_000, 9_999_999),
+    "isams_school_id": (3_000_000, 9_999_999),
+}
+
+# Person BKs stay inside the school's block, from the first four-digit number on
+first_person_bk = 1000
+
+# iSAMS user codes: prefix and the numbers each school's codes are drawn from
+user_code_ranges = {
+    "Student": ("stu", lambda school: (school * 10_000, (school + 1) * 10_000)),
+    "Staff": ("stf", lambda school: (school * 100_000 + 10_000, school * 100_000 + 99_999)),
+}
+
+
+# 64-bit key for one ID space
+def space_key(name, seed=42):
+    return np.uint64(int.from_bytes(hashlib.blake2b(f"{seed}:{name}".encode(), digest_size=8).digest(), "little"))
+
+
+# splitmix64 finaliser, wrapping on overflow like the C original
+def mix(z):
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+# Balanced Feistel network on 2 * half bits; a bijection for any key
+def feistel(x, half, key):
+    mask = np.uint64((1 << half) - 1)
+    left, right = x >> np.uint64(half), x & mask
+    for r in range(feistel_rounds):
+        left, right = right, left ^ (mix(right ^ key ^ np.uint64(r * 0x9E3779B97F4A7C15 % 2 ** 64)) & mask)
+    return (left << np.uint64(half)) | right
+
+
+# Ordinals in [0, size) mapped to distinct values in [0, size). The network permutes the smallest
+# even-width power of two holding size; values past size walk the cycle until they land inside it,
+# which keeps the mapping a permutation of [0, size).
+def permute(ordinals, size, key):
+    ordinals = np.asarray(ordinals, dtype=np.uint64)
+    if len(ordinals) and int(ordinals.max()) >= size:
+        raise ValueError(f"Ordinal {int(ordinals.max())} is outside an ID space of {size}")
+    half = max(1, (int(size - 1).bit_length() + 1) // 2)
+    values = feistel(ordinals, half, key)
+    outside = values >= size
+    while outside.any():
+        values[outside] = feistel(values[outside], half, key)
+        outside = values >= size
+    return values.astype(np.int64)
+
+
+# Global ordinals of one school's people: schools are numbered one after another, people_per_school each
+def school_ordinals(school, n, people_per_school):
+    return school * people_per_school + np.arange(n)
+
+
+# IDs of one of the global_id_ranges for the given ordinals
+def global_ids(field, ordinals, seed=42):
+    start, stop = global_id_ranges[field]
+    return start + permute(ordinals, stop - start, space_key(field, seed))
+
+
+# The first n person BKs of a school, unique within its block
+def person_bks(school, n, seed=42):
+    size = person_bk_block - first_person_bk
+    return school * person_bk_block + first_person_bk + permute(np.arange(n), size, space_key(f"person_bk:{school}", seed))
+
+
+# The first n iSAMS user codes of a school for students or staff
+def user_codes(school, n, account_type="Student", seed=42):
+    prefix, numbers = user_code_ranges[account_type]
+    start, stop = numbers(school)
+    codes = start + permute(np.arange(n), stop - start, space_key(f"isams_user_code:{account_type}:{school}", seed))
+    return [f"{prefix}{str(code).zfill(4)}" for code in codes]
@@ -0,0 +1,212 @@
+import argparse
+import datetime
+import sqlalchemy
+from sqlalchemy import text
+from reference_cache import quote
+from warehouse_db import engine
+
+# Versioned schema changes for the warehouse tables from Initial database.sql. Each migration builds
+# its statements from the live schema, runs once, and is recorded in schema_migrations. MariaDB commits
+# DDL as it goes, so a migration that fails halfway picks up where it stopped when run again.
+migrations_table = "schema_migrations"
+
+# Composite indexes for what the scripts filter and join on: the current year plus a school's BK range,
+# teaching group joins, and the report card's student/subject lookups
+fact_indexes = {
+    "fact Attendance": {
+        "idx_attendance_student_date": ["Student warehouse bk", "Date pk"],
+        "idx_attendance_group_date": ["Teaching Group pk", "Date pk"],
+    },
+    "fact_report": {
+        "idx_report_year_student": ["Academic year", "Student", "Subject"],
+        "idx_report_group": ["Teaching group pk"],
+    },
+    "fact Behaviour": {
+        "idx_behaviour_student_date": ["Student", "Date recorded"],
+        "idx_behaviour_teacher": ["Recording teacher"],
+    },
+    "fact student class enrolement": {
+        "idx_enrolment_year_student": ["Academic year", "Student warehouse BK"],
+        "idx_enrolment_group": ["Teaching group ID"],
+    },
+}
+
+# TEXT columns MariaDB can neither index without a prefix nor partition on
+key_column_types = {
+    "fact student class enrolement": {"Academic year": "VARCHAR(30)"},
+}
+
+# One range partition per academic year: by dim_Dates id for tables keyed on a date, by the year label
+# for the rest. Every unique key must include the partition column, so primary keys are widened.
+fact_partitions = {
+    "fact Attendance": {"column": "Date pk", "by": "date", "primary_key": ["pk", "Date pk"],
+                        "drop_indexes": ["IX_fact Attendance"]},
+    "fact_report": {"column": "Academic year", "by": "year", "primary_key": ["pk", "Academic year"]},
+    "fact Behaviour": {"column": "Date recorded", "by": "date"},
+    "fact student class enrolement": {"column": "Academic year", "by": "year"},
+}
+overflow_partition = "pmax"
+
+
+def is_mysql(conn):
+    return conn.dialect.name in ("mysql", "mariadb")
+
+
+def column_list(conn, columns):
+    return ", ".join(quote(conn, c) for c in columns)
+
+
+def add_fact_indexes(conn):
+    inspector = sqlalchemy.inspect(conn)
+    statements = []
+    for table, indexes in fact_indexes.items():
+        if not inspector.has_table(table):
+            continue
+        if is_mysql(conn):
+            columns = {c["name"]: c["type"] for c in inspector.get_columns(table)}
+            for name, ddl in key_column_types.get(table, {}).items():
+                if isinstance(columns.get(name), sqlalchemy.Text):
+                    statements.append(f"ALTER TABLE {quote(conn, table)} MODIFY {quote(conn, name)} {ddl}")
+        existing = {i["name"] for i in inspector.get_indexes(table)}
+        for name, columns in indexes.items():
+            if name not in existing:
+                statements.append(f"CREATE INDEX {quote(conn, name)} ON {quote(conn, table)} ({column_list(conn, columns)})")
+    return statements
+
+
+# Academic years in dim_Dates with the upper bound of each year's partition, oldest first
+def year_bounds(conn):
+    years = conn.execute(text("""
+        SELECT `Academic Year`, MIN(id) FROM dim_Dates
+        WHERE `Academic Year` LIKE '____-____' GROUP BY `Academic Year` ORDER BY `Academic Year`
+    """)).all()
+    bounds = []
+    for i, (year, first_id) in enumerate(years):
+        # A year's dates end where the next year's start; the last known year gets twelve months
+        next_first_id = years[i + 1][1] if i + 1 < len(years) else first_id + 10000
+        end_year = int(year[-4:])
+        bounds.append({"year": year, "name": f"p{year.replace('-', '_')}",
+                       "date": int(next_first_id), "label": f"{end_year}-{end_year + 1}"})
+    return bounds
+
+
+def partition_definitions(spec, bounds):
+    parts = []
+    for b in bounds:
+        limit = b["date"] if spec["by"] == "date" else f"'{b['label']}'"
+        parts.append(f"PARTITION {b['name']} VALUES LESS THAN ({limit})")
+    maxvalue = "MAXVALUE" if spec["by"] == "date" else "(MAXVALUE)"
+    parts.append(f"PARTITION {overflow_partition} VALUES LESS THAN {maxvalue}")
+    return ", ".join(parts)
+
+
+def existing_partitions(conn, table):
+    return [r[0] for r in conn.execute(text("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """), {"table": table})]
+
+
+def partition_fact_tables(conn):
+    if not is_mysql(conn):
+        print("Range partitioning needs MariaDB or MySQL; only the indexes apply here.")
+        return []
+    inspector = sqlalchemy.inspect(conn)
+    bounds = year_bounds(conn)
+    statements = []
+    for table, spec in fact_partitions.items():
+        if not inspector.has_table(table) or existing_partitions(conn, table):
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table)}
+        for name in spec.get("drop_indexes", []):
+            if name in existing:
+                statements.append(f"ALTER TABLE {quote(conn, table)} DROP INDEX {quote(conn, name)}")
+        if "primary_key" in spec:
+            statements.append(f"ALTER TABLE {quote(conn, table)} DROP PRIMARY KEY, "
+                              f"ADD PRIMARY KEY ({column_list(conn, spec['primary_key'])})")
+        how = "RANGE" if spec["by"] == "date" else "RANGE COLUMNS"
+        statements.append(f"ALTER TABLE {quote(conn, table)} PARTITION BY {how} ({quote(conn, spec['column'])}) "
+                          f"({partition_definitions(spec, bounds)})")
+    return statements
+
+
+# Split new academic years out of the overflow partition once dim_Dates has them. Runs on every migrate.
+def add_year_partitions(conn):
+    if not is_mysql(conn):
+        return []
+    bounds = year_bounds(conn)
+    statements = []
+    for table, spec in fact_partitions.items():
+        existing = existing_partitions(conn, table)
+        if overflow_partition not in existing:
+            continue
+        new = [b for b in bounds if b["name"] not in existing and b["name"] > max(existing[:-1] or [""])]
+        if new:
+            statements.append(f"ALTER TABLE {quote(conn, table)} REORGANIZE PARTITION {overflow_partition} "
+                              f"INTO ({partition_definitions(spec, new)})")
+    return statements
+
+
+# (version, description, function returning the statements to run)
+migrations = [
+    (1, "composite indexes on the fact tables", add_fact_indexes),
+    (2, "range partitions by academic year on the fact tables", partition_fact_tables),
+]
+
+
+def ensure_migrations_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {migrations_table} (
+                version INT PRIMARY KEY,
+                description VARCHAR(200) NOT NULL,
+                applied_at DATETIME NOT NULL
+            )
+        """))
+
+
+def applied_versions(engine):
+    ensure_migrations_table(engine)
+    with engine.connect() as conn:
+        return {r[0] for r in conn.execute(text(f"SELECT version FROM {migrations_table}"))}
+
+
+# Apply every pending migration up to `target`. With dry_run the statements are printed instead.
+def migrate(engine=engine, target=None, dry_run=False):
+    applied = applied_versions(engine)
+    for version, description, build in migrations:
+        if version in applied or (target is not None and version > target):
+            continue
+        with engine.begin() as conn:
+            statements = build(conn)
+            print(f"Migration {version}: {description} ({len(statements)} statements)")
+            for sql in statements:
+                print(f"  {sql}")
+                if not dry_run:
+                    conn.execute(text(sql))
+            if not dry_run:
+                conn.execute(text(f"INSERT INTO {migrations_table} (version, description, applied_at) "
+                                  f"VALUES (:version, :description, :applied_at)"),
+                             {"version": version, "description": description,
+                              "applied_at": datetime.datetime.now().replace(microsecond=0)})
+
+    with engine.begin() as conn:
+        for sql in add_year_partitions(conn):
+            print(f"  {sql}")
+            if not dry_run:
+                conn.execute(text(sql))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending warehouse schema migrations")
+    parser.add_argument("--to", type=int, help="stop after this version")
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without running them")
+    parser.add_argument("--list", action="store_true", help="show every migration and whether it is applied")
+    args = parser.parse_args()
+    if args.list:
+        applied = applied_versions(engine)
+        for version, description, _ in migrations:
+            print(f"{version:>4}  {'applied' if version in applied else 'pending':<8} {description}")
+    else:
+        migrate(engine, args.to, args.dry_run)
@@ -0,0 +1,253 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+import handoff
+from scale import add_scale_arguments, run_partitioned
+from warehouse_db import engine
+
+# Runs the generator scripts in dependency order, with independent stages at the same time.
+# Every stage is loaded into this process, so they all share the pooled engine in warehouse_db.
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+state_file = os.path.join(repo_dir, ".cache", "pipeline_state.json")
+
+# script, the function it runs (per school unless partitioned is False) and the stages it reads from.
+# Every stage comes after the ones it reads from, which --in-memory relies on.
+stages = {
+    "people": {"script": "CreatePeople.py", "function": "create_school", "after": []},
+    "students": {"script": "create students.py", "function": "create_school_students", "after": ["people"]},
+    # Reads students to check its classes can be filled
+    "staff": {"script": "create staff.py", "function": "create_school", "after": ["people", "students"]},
+    "enrolments": {"script": "create_enrolements.py", "function": "enrol_school", "after": ["students", "staff"]},
+    "attendance": {"script": "create attendance.py", "function": "create_school_attendance", "after": ["enrolments"]},
+    "report_data": {"script": "create report data.py", "function": "create_school_reports", "after": ["enrolments"]},
+    "behaviours": {"script": "create_behaviours.py", "function": "create_school_behaviours", "after": ["students", "staff"]},
+    "report_card": {"script": "Create pivoted report card.py", "function": "refresh", "after": ["report_data"],
+                    "partitioned": False},
+    "attendance_summary": {"script": "attendance_summary.py", "function": "refresh", "after": ["attendance"],
+                           "partitioned": False},
+    # Fails the run when a key is orphaned, repeated or has overlapping versions
+    "validate": {"script": "data_checks.py", "function": "validate",
+                 "after": ["report_card", "attendance_summary", "behaviours"], "partitioned": False},
+    # create staff.py already writes teaching groups for years 3-13, so this only runs when asked for
+    "teaching_groups": {"script": "create_teaching_groups.py", "function": "create_school_groups", "after": ["staff"],
+                        "optional": True},
+}
+
+
+# Per-school stage functions already loaded in this process; --in-memory runs load theirs before the
+# workers fork
+stage_functions = {}
+
+
+def load_stage(name):
+    path = os.path.join(repo_dir, stages[name]["script"])
+    spec = importlib.util.spec_from_file_location(f"stage_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so per-school functions can be pickled to the forked workers by name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return getattr(module, stages[name]["function"])
+
+
+# A stage's per-school function, loaded on first use. run_stage hands workers this rather than the
+# function itself: stages run on executor threads, so their workers are spawned, and a spawned worker
+# cannot import a stage module by its registered name but can import this one.
+def run_stage_school(name, school, scale_factor):
+    if name not in stage_functions:
+        stage_functions[name] = load_stage(name)
+    return stage_functions[name](school, scale_factor=scale_factor)
+
+
+def run_stage(name, scale_factor, workers):
+    started = time.perf_counter()
+    fn = load_stage(name)
+    if stages[name].get("partitioned", True):
+        stage_functions[name] = fn
+        rows = sum(r or 0 for r in run_partitioned(partial(run_stage_school, name), scale_factor, workers, engine))
+    else:
+        rows = fn() or 0
+    return {"status": "done", "rows": int(rows), "seconds": round(time.perf_counter() - started, 2)}
+
+
+# The requested stages and everything upstream of them
+def with_dependencies(names):
+    wanted = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(stages[name]["after"])
+    return wanted
+
+
+def load_state(scale_factor, restart=False):
+    if restart or not os.path.exists(state_file):
+        return {"scale_factor": scale_factor, "stages": {}}
+    with open(state_file) as f:
+        state = json.load(f)
+    if state["scale_factor"] != scale_factor:
+        raise SystemExit(f"The last run used --scale-factor {state['scale_factor']}; "
+                         f"use --restart to start again at {scale_factor}.")
+    return state
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(f"{state_file}.tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{state_file}.tmp", state_file)
+
+
+# After a run in which every stage finished there is nothing to resume, so the next run starts afresh
+def clear_state():
+    if os.path.exists(state_file):
+        os.remove(state_file)
+
+
+# Start every stage whose dependencies are done, as soon as they are. After a failure nothing new is
+# started; the stages already running finish and the next run resumes from the failed one.
+def run_pipeline(names, scale_factor=1.0, workers=1, parallel=3, restart=False):
+    state = load_state(scale_factor, restart)
+    done = {n for n, s in state["stages"].items() if s["status"] == "done"}
+    todo = with_dependencies(names) - done
+    for name in sorted(done & with_dependencies(names)):
+        print(f"Skipping {name}, finished in an earlier run.")
+
+    failed = False
+    running = {}
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        while todo or running:
+            ready = [n for n in sorted(todo) if set(stages[n]["after"]) <= done] if not failed else []
+            for name in ready:
+                print(f"Starting {name}...")
+                todo.discard(name)
+                state["stages"][name] = {"status": "running", "started": datetime.datetime.now().isoformat()}
+                running[executor.submit(run_stage, name, scale_factor, workers)] = name
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    state["stages"][name].update(future.result())
+                    done.add(name)
+                    print(f"Finished {name} in {state['stages'][name]['seconds']}s.")
+                except Exception as e:
+                    failed = True
+                    state["stages"][name].update({"status": "failed", "error": repr(e)})
+                    print(f"Stage {name} failed:")
+                    traceback.print_exception(e)
+            save_state(state)
+
+    print_timings(state)
+    if not failed:
+        clear_state()
+    return not failed
+
+
+# Every per-school stage for one school in this process, each taking what the ones before it kept
+# in handoff rather than reading it back. Returns rows and seconds per stage.
+def run_school(school, scale_factor, names):
+    handoff.enabled = True
+    results = {}
+    try:
+        for name in names:
+            started = time.perf_counter()
+            rows = stage_functions[name](school, scale_factor) or 0
+            results[name] = (int(rows), time.perf_counter() - started)
+    finally:
+        handoff.clear(school)
+        handoff.enabled = False
+    return results
+
+
+# Run the per-school stages school by school, handing frames between them in memory, then the stages
+# that work on the whole warehouse. A stage finished in an earlier run is skipped and the stages after
+# it read its table from the database instead.
+def run_in_memory(names, scale_factor=1.0, workers=1, restart=False):
+    state = load_state(scale_factor, restart)
+    done = {n for n, s in state["stages"].items() if s["status"] == "done"}
+    wanted = with_dependencies(names)
+    for name in sorted(done & wanted):
+        print(f"Skipping {name}, finished in an earlier run.")
+    todo = [n for n in stages if n in wanted - done]
+    per_school = [n for n in todo if stages[n].get("partitioned", True)]
+
+    if per_school:
+        print(f"Running {', '.join(per_school)} for each school in memory...")
+        for name in per_school:
+            stage_functions[name] = load_stage(name)
+            state["stages"][name] = {"status": "running", "started": datetime.datetime.now().isoformat()}
+        try:
+            results = run_partitioned(partial(run_school, names=per_school), scale_factor, workers, engine)
+        except Exception as e:
+            for name in per_school:
+                state["stages"][name].update({"status": "failed", "error": repr(e)})
+            save_state(state)
+            traceback.print_exception(e)
+            print_timings(state)
+            return False
+        # Seconds are summed over the schools
+        for name in per_school:
+            state["stages"][name].update({
+                "status": "done", "rows": sum(r[name][0] for r in results),
+                "seconds": round(sum(r[name][1] for r in results), 2),
+            })
+        save_state(state)
+
+    for name in todo:
+        if name in per_school:
+            continue
+        print(f"Starting {name}...")
+        state["stages"][name] = {"status": "running", "started": datetime.datetime.now().isoformat()}
+        try:
+            state["stages"][name].update(run_stage(name, scale_factor, workers))
+        except Exception as e:
+            state["stages"][name].update({"status": "failed", "error": repr(e)})
+            save_state(state)
+            print(f"Stage {name} failed:")
+            traceback.print_exception(e)
+            print_timings(state)
+            return False
+        save_state(state)
+
+    print_timings(state)
+    clear_state()
+    return True
+
+
+def print_timings(state):
+    print(f"{'stage':<20}{'status':<10}{'seconds':>10}{'rows':>12}{'rows/s':>12}")
+    for name, s in state["stages"].items():
+        seconds, rows = s.get("seconds"), s.get("rows")
+        rate = f"{rows / seconds:,.0f}" if seconds and rows else ""
+        print(f"{name:<20}{s['status']:<10}{seconds if seconds is not None else '':>10}"
+              f"{rows if rows is not None else '':>12}{rate:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the generator scripts as one pipeline")
+    add_scale_arguments(parser)
+    parser.add_argument("--stages", nargs="+", choices=list(stages),
+                        default=[n for n, s in stages.items() if not s.get("optional")],
+                        help="stages to run; the stages they depend on run first")
+    parser.add_argument("--parallel", type=int, default=3, help="stages to run at the same time")
+    parser.add_argument("--restart", action="store_true", help="forget earlier runs and start from the first stage")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="run every per-school stage of a school in one process, passing the generated "
+                             "frames on instead of reading the tables back")
+    args = parser.parse_args()
+    if args.in_memory:
+        ok = run_in_memory(args.stages, args.scale_factor, args.workers, args.restart)
+    else:
+        ok = run_pipeline(args.stages, args.scale_factor, args.workers, args.parallel, args.restart)
+    raise SystemExit(0 if ok else 1)
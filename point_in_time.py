@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from reference_cache import read_reference
+from warehouse_db import engine as default_engine
+
+# Point-in-time lookups against type 2 dimensions. Each fact row gets the one version whose
+# [effective, expiry] range holds its date, found with a sorted merge_asof per key rather than by
+# joining every version and filtering, so the work grows with the rows and not with the history.
+
+# Validity columns of the dimensions facts are joined to
+student_versions_spec = {
+    "table": "dim_students_isams", "key": "Person BK",
+    "effective": "Row Effective Date", "expiry": "Row Expiration Date",
+}
+
+
+# yyyymmdd ids such as dim_Dates.id or Date recorded as timestamps
+def date_ids_to_timestamps(ids):
+    return pd.to_datetime(pd.Series(ids).astype("Int64").astype("string"), format="%Y%m%d", errors="coerce")
+
+
+# Attach `columns` of the version valid at each fact's `fact_time` to `facts`, matching `fact_key` to
+# `version_key`. Both ends of a version's range are inclusive and a missing expiry is open. With
+# how="left" facts without a valid version get missing values; with how="inner" they are dropped.
+# Rows keep their order and index.
+def as_of_join(facts, versions, fact_key, fact_time, version_key, effective, expiry, columns, how="left"):
+    right = versions[[version_key, effective, expiry] + columns].rename(
+        columns={version_key: "_key", effective: "_effective", expiry: "_expiry"}
+    )
+    right["_effective"] = pd.to_datetime(right["_effective"], errors="coerce").astype("datetime64[ns]")
+    right["_expiry"] = pd.to_datetime(right["_expiry"], errors="coerce").astype("datetime64[ns]")
+    right = right[right["_effective"].notna()].sort_values("_effective", kind="stable")
+
+    left = pd.DataFrame({
+        "_key": facts[fact_key].to_numpy(),
+        "_time": pd.to_datetime(facts[fact_time], errors="coerce").astype("datetime64[ns]").to_numpy(),
+        "_row": np.arange(len(facts)),
+    })
+    timed = left[left["_time"].notna()].sort_values("_time", kind="stable")
+    # merge_asof needs the keys on both sides to share a dtype
+    key_dtype = np.result_type(timed["_key"].dtype, right["_key"].dtype) if len(right) else timed["_key"].dtype
+    matched = pd.merge_asof(
+        timed.astype({"_key": key_dtype}), right.astype({"_key": key_dtype}),
+        left_on="_time", right_on="_effective", by="_key", direction="backward",
+    )
+    # The latest version that started on or before the fact only counts if it had not yet expired
+    valid = matched["_expiry"].isna() | (matched["_time"] <= matched["_expiry"])
+    matched = matched[valid.to_numpy() & matched["_effective"].notna().to_numpy()]
+
+    attached = matched.set_index("_row")[columns].reindex(np.arange(len(facts)))
+    joined = facts.copy()
+    for column in columns:
+        joined[column] = attached[column].to_numpy()
+    if how == "inner":
+        return joined.iloc[np.sort(matched["_row"].to_numpy())]
+    return joined
+
+
+# Student attributes as they were on each fact's date. `at` names a column of timestamps or, with
+# date_ids=True, of yyyymmdd ids.
+def student_attributes(facts, student_bk, at, columns, date_ids=False, how="left", engine=default_engine):
+    spec = student_versions_spec
+    versions = read_reference(engine, spec["table"], [spec["key"], spec["effective"], spec["expiry"]] + columns)
+    if date_ids:
+        facts = facts.assign(_at=date_ids_to_timestamps(facts[at]).to_numpy())
+        at = "_at"
+    joined = as_of_join(facts, versions, student_bk, at, spec["key"], spec["effective"], spec["expiry"], columns, how)
+    return joined.drop(columns=["_at"], errors="ignore")
@@ -0,0 +1,18 @@
+import time
+
+
+# A progress callback for long loops: report(done) prints at most once every `interval` seconds, and
+# always once everything is done, so printing never becomes the slow part of the loop
+def throttled_progress(label, total, interval=2.0):
+    started = time.perf_counter()
+    last = started
+
+    def report(done):
+        nonlocal last
+        now = time.perf_counter()
+        if done < total and now - last < interval:
+            return
+        last = now
+        print(f"{label}: {done}/{total} ({done / max(now - started, 1e-9):,.0f}/s)")
+
+    return report
@@ -0,0 +1,157 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import time
+from sqlalchemy import text
+from benchmark import git_commit, results_dir
+from reference_cache import read_dates, academic_year_for
+from scale import school_bk_range
+from warehouse_db import engine
+
+# The queries the generators and the report card run against the fact tables, timed and EXPLAINed
+# so index and partition changes can be checked before and after, e.g.
+#   python query_benchmark.py --migrate --output queries.json
+queries = {
+    "attendance enrolments": """
+        SELECT `Teaching group ID`, `Student ID`, `Student warehouse BK` FROM `fact student class enrolement`
+        WHERE `Academic year` = :year AND `Student warehouse BK` BETWEEN :lo AND :hi
+    """,
+    "report data enrolments": """
+        SELECT e.`Student warehouse BK`, e.`Teaching group ID`, e.`Academic year`, g.`Subject name`
+        FROM `fact student class enrolement` e
+        JOIN `dim Teaching Groups` g ON e.`Teaching group ID` = g.pk
+        WHERE e.`Academic year` = :year AND e.`Student warehouse BK` BETWEEN :lo AND :hi
+    """,
+    "report card students": """
+        SELECT `Student`, `Subject`, `Term`, `Data type`, `Result` FROM `fact_report`
+        WHERE `Academic year` = :year AND `Student` BETWEEN :lo AND :lo + 200
+    """,
+    "report card year": """
+        SELECT COUNT(*) FROM `fact_report` WHERE `Academic year` = :year
+    """,
+    "group reports": """
+        SELECT COUNT(*) FROM `fact_report` WHERE `Teaching group pk` = :group
+    """,
+    "student attendance term": """
+        SELECT `Mark`, COUNT(*) FROM `fact Attendance`
+        WHERE `Student warehouse bk` = :student AND `Date pk` BETWEEN :term_start AND :term_end
+        GROUP BY `Mark`
+    """,
+    "group attendance term": """
+        SELECT `Date pk`, COUNT(*) FROM `fact Attendance`
+        WHERE `Teaching Group pk` = :group AND `Date pk` BETWEEN :term_start AND :term_end
+        GROUP BY `Date pk`
+    """,
+    "attendance term": """
+        SELECT `Mark`, COUNT(*) FROM `fact Attendance` WHERE `Date pk` BETWEEN :term_start AND :term_end GROUP BY `Mark`
+    """,
+    "student behaviour year": """
+        SELECT COUNT(*), SUM(`Points`) FROM `fact Behaviour`
+        WHERE `Student` = :student AND `Date recorded` BETWEEN :year_start AND :year_end
+    """,
+}
+
+
+# Parameters taken from the data, so every run asks the same questions of the same rows
+def query_params(conn):
+    year = academic_year_for(engine, datetime.date.today())
+    dates = read_dates(engine)
+    this_year = dates[dates["Academic Year"] == year]
+    first_term = this_year[this_year["Term name"] == this_year.sort_values("id")["Term name"].iloc[0]]
+    lo, hi = school_bk_range(0)
+    student = conn.execute(text("SELECT MIN(`Student warehouse bk`) FROM `fact Attendance`")).scalar()
+    group = conn.execute(text("SELECT MIN(`Teaching group pk`) FROM `fact_report`")).scalar()
+    return {
+        "year": year, "lo": lo, "hi": hi, "student": student or 0, "group": group or 0,
+        "term_start": int(first_term["id"].min()), "term_end": int(first_term["id"].max()),
+        "year_start": int(this_year["id"].min()), "year_end": int(this_year["id"].max()),
+    }
+
+
+# EXPLAIN output as a list of dicts; MariaDB also shows which partitions are read
+def explain(conn, sql, params):
+    if conn.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN"
+    elif getattr(conn.dialect, "is_mariadb", False):
+        prefix = "EXPLAIN PARTITIONS"
+    else:
+        prefix = "EXPLAIN"
+    result = conn.execute(text(f"{prefix} {sql}"), params)
+    return [dict(zip(result.keys(), row)) for row in result]
+
+
+def time_query(conn, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = conn.execute(text(sql), params).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"rows": len(rows), "median_ms": round(statistics.median(timings), 2), "min_ms": round(min(timings), 2)}
+
+
+def run_queries(engine, repeat=5):
+    results = {}
+    with engine.connect() as conn:
+        params = query_params(conn)
+        for name, sql in queries.items():
+            # One untimed run so every query starts from a warm buffer pool
+            conn.execute(text(sql), params).all()
+            results[name] = {**time_query(conn, sql, params, repeat), "plan": explain(conn, sql, params)}
+            print(f"{name:<28}{results[name]['median_ms']:>10} ms")
+    return results
+
+
+# Short summary of a plan: the index each table is read through and the rows the optimiser expects
+def plan_summary(plan):
+    if plan and "detail" in plan[0]:
+        return "; ".join(str(step["detail"]) for step in plan)
+    return "; ".join(f"{step.get('table')}:{step.get('key') or 'scan'}~{step.get('rows')}"
+                     + (f" [{step['partitions']}]" if step.get("partitions") else "") for step in plan)
+
+
+def print_comparison(before, after):
+    print(f"{'query':<28}{'before ms':>12}{'after ms':>12}{'change':>10}")
+    for name in queries:
+        b, a = before.get(name), after.get(name)
+        if not (b and a):
+            continue
+        change = f"{(a['median_ms'] - b['median_ms']) / b['median_ms']:+.0%}" if b["median_ms"] else ""
+        print(f"{name:<28}{b['median_ms']:>12}{a['median_ms']:>12}{change:>10}")
+        print(f"    before: {plan_summary(b['plan'])}")
+        print(f"    after:  {plan_summary(a['plan'])}")
+
+
+def json_default(value):
+    return str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and EXPLAIN the fact table queries")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per query")
+    parser.add_argument("--migrate", action="store_true",
+                        help="run the queries, apply pending migrations, then run them again")
+    parser.add_argument("--output", help="results file (default .cache/benchmarks/queries-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {"before": run_queries(engine, args.repeat)}
+    if args.migrate:
+        from migrations import migrate
+        migrate(engine)
+        # Fresh connections, so no statement prepared against the old schema is reused
+        engine.dispose()
+        results["after"] = run_queries(engine, args.repeat)
+        print_comparison(results["before"], results["after"])
+    if args.compare:
+        with open(args.compare) as f:
+            earlier = json.load(f)
+        print_comparison(earlier.get("after", earlier["before"]), results.get("after", results["before"]))
+
+    output = args.output or os.path.join(results_dir, f"queries-{git_commit()}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"commit": git_commit(), "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "database": engine.dialect.name, "repeat": args.repeat, **results}, f, indent=2, default=json_default)
+    print(f"Saved results to {output}")
@@ -0,0 +1,139 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+from sqlalchemy import text
+
+# Small dimensions that most stages read. They are kept as local files and only re-read from the
+# database when their signature changes, so a full pipeline run reads each one once.
+cache_dir = os.environ.get(
+    "WAREHOUSE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "reference")
+)
+
+# Reference tables and the key column used for the cheap signature on databases without CHECKSUM TABLE
+reference_tables = {
+    "dim_Dates": "id",
+    "dim_report_grade": "id",
+    "dim Departments": "id",
+    "dim Teaching Groups": "pk",
+    "dim_students_isams": "id",
+    "dim Staff": "pk",
+}
+
+# Parquet keeps dtypes and can read single columns; without pyarrow fall back to pickle, which keeps dtypes too
+try:
+    import pyarrow  # noqa: F401
+    file_format = "parquet"
+except ImportError:
+    file_format = "pickle"
+
+
+def quote(engine, name):
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+# Changes whenever rows are added, removed or updated. MariaDB checksums the whole table server side;
+# elsewhere the row count and highest key catch the appends and deletes the generators make, and for a
+# type 2 dimension the count and latest of its expiry dates catch versions scd2_merge expires in place.
+def table_signature(engine, table):
+    from scd2_merge import dimensions
+    with engine.connect() as conn:
+        if engine.dialect.name in ("mysql", "mariadb"):
+            return str(conn.execute(text(f"CHECKSUM TABLE {quote(engine, table)}")).fetchone()[1])
+        measures = ["COUNT(*)", f"MAX({quote(engine, reference_tables.get(table, 'id'))})"]
+        if table in dimensions:
+            expiry = quote(engine, dimensions[table]["expiry"])
+            measures += [f"COUNT({expiry})", f"MAX({expiry})"]
+        row = conn.execute(text(f"SELECT {', '.join(measures)} FROM {quote(engine, table)}")).fetchone()
+        return ":".join(str(value) for value in row)
+
+
+# One cache folder per database, so pointing a script at another server never reuses stale files
+def cache_path(engine, table):
+    database = hashlib.sha1(engine.url.render_as_string(hide_password=True).encode()).hexdigest()[:12]
+    name = table.replace(" ", "_")
+    return os.path.join(cache_dir, database, name)
+
+
+# Driver date objects become datetime64 so callers get the same dtypes from the database and the cache
+def typed_frame(df):
+    for col in df.columns[df.dtypes == object]:
+        first = df[col].first_valid_index()
+        if first is not None and isinstance(df[col][first], datetime.date):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+
+# Temporary name for a file about to replace `name`, unique to this process and thread so concurrent
+# writers of the same table never rename each other's file
+def tmp_name(name):
+    return f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_cache(df, path):
+    tmp = tmp_name(path)
+    if file_format == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, f"{path}.{file_format}")
+
+
+def read_cache(path, columns=None):
+    if file_format == "parquet":
+        return pd.read_parquet(f"{path}.{file_format}", columns=columns)
+    df = pd.read_pickle(f"{path}.{file_format}")
+    return df[columns] if columns else df
+
+
+# A whole reference table as a typed DataFrame, from the local cache when it is still current
+def read_reference(engine, table, columns=None):
+    path = cache_path(engine, table)
+    signature = table_signature(engine, table)
+    try:
+        with open(f"{path}.json") as f:
+            if json.load(f)["signature"] == signature:
+                return read_cache(path, columns)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    df = typed_frame(pd.read_sql(f"SELECT * FROM {quote(engine, table)}", engine))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_cache(df, path)
+    # Written after the data, so a reader never pairs a new signature with old rows
+    tmp = tmp_name(f"{path}.json")
+    with open(tmp, "w") as f:
+        json.dump({"table": table, "signature": signature, "rows": len(df)}, f)
+    os.replace(tmp, f"{path}.json")
+    return df[columns] if columns else df
+
+
+# dim_Dates with the date column as datetime64, named Date as the scripts expect
+def read_dates(engine):
+    dates = read_reference(engine, "dim_Dates")
+    dates = dates.rename(columns={c: "Date" for c in dates.columns if c.lower() == "date"})
+    dates["Date"] = pd.to_datetime(dates["Date"], errors="coerce")
+    return dates
+
+
+# The academic year a day falls in
+def academic_year_for(engine, day):
+    dates = read_dates(engine)
+    match = dates.loc[dates["Date"] == pd.Timestamp(day), "Academic Year"]
+    if match.empty:
+        raise ValueError(f"{day} is not in dim_Dates")
+    return match.iloc[0]
+
+
+# First day in dim_Dates of the academic year `day` falls in
+def academic_year_start(engine, day):
+    dates = read_dates(engine)
+    return dates.loc[dates["Academic Year"] == academic_year_for(engine, day), "Date"].min()
+
+
+def clear_cache():
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            os.remove(os.path.join(root, name))
@@ -0,0 +1,101 @@
+import pandas as pd
+
+# Keys of one report card row
+card_keys = ['Student', 'Academic year', 'Term', 'Subject', 'Teacher a b or c']
+
+# Derived "A minus B" columns, in output order
+delta_columns = [
+    ('Numeric result_Attainment', 'Numeric result_Target', 'Current attainment minus target'),
+    ('Numeric result_Attainment', 'Numeric result_If Challenged', 'Current attainment minus CAT4 target'),
+    ('Numeric result_Target', 'Numeric result_If Challenged', 'Target minus CAT4 target'),
+
+    ('Numeric result_IGCSE Grade', 'Numeric result_Target', 'IGCSE minus target'),
+    ('Numeric result_IGCSE Grade', 'Numeric result_If Challenged', 'IGCSE minus CAT4'),
+    ('Numeric result_IGCSE Grade', 'Numeric result_Attainment', 'IGCSE minus attainment'),
+    ('Numeric result_IGCSE Grade', 'Numeric result_Predicted', 'IGCSE minus prediction'),
+
+    ('Numeric result_AS Grade', 'Numeric result_Target', 'AS minus target'),
+    ('Numeric result_AS Grade', 'Numeric result_If Challenged', 'AS minus CAT4'),
+    ('Numeric result_AS Grade', 'Numeric result_Attainment', 'AS minus attainment'),
+    ('Numeric result_AS Grade', 'Numeric result_Predicted', 'AS minus prediction'),
+
+    ('Numeric result_A2 Grade', 'Numeric result_Target', 'A2 minus target'),
+    ('Numeric result_A2 Grade', 'Numeric result_If Challenged', 'A2 minus CAT4'),
+    ('Numeric result_A2 Grade', 'Numeric result_Attainment', 'A2 minus attainment'),
+    ('Numeric result_A2 Grade', 'Numeric result_Predicted', 'A2 minus prediction'),
+
+    ('Numeric result_AS Grade', 'Numeric result_IGCSE Grade', 'AS minus IGCSE'),
+    ('Numeric result_A2 Grade', 'Numeric result_IGCSE Grade', 'A2 minus IGCSE'),
+    ('Numeric result_A2 Grade', 'Numeric result_AS Grade', 'A2 minus AS'),
+]
+
+# Rename for clarity
+column_mapping = {
+    'Result_Attainment': 'Current Attainment',
+    'Result_Target': 'Target grade',
+    'Result_If Challenged': 'CAT4 Target grade',
+    'Result_AB': 'Attitudinal behaviours',
+    'Result_OB': 'Organisational behaviours',
+}
+
+
+# One wide row per card key, with the average AB/OB entry date. Keys may be categorical, so only
+# combinations that occur are grouped.
+def pivot_reports(report_df):
+    avg_entry = report_df[report_df['Data type'].isin(['AB', 'OB'])].groupby(card_keys, observed=True)['Entry Date'].mean().reset_index()
+
+    # Keep latest record per grouping
+    latest = report_df.drop_duplicates(subset=card_keys + ['Data type'], keep='first').merge(
+        avg_entry, on=card_keys, how='left', suffixes=('', '_avg')
+    )
+
+    pivoted = latest.pivot_table(
+        index=card_keys + ['Entry Date_avg'],
+        columns='Data type',
+        values=['Result', 'Numeric result', 'Result pk'],
+        aggfunc='first',
+        observed=True
+    ).reset_index()
+
+    pivoted.columns = ['_'.join(col).strip() if col[1] else col[0] for col in pivoted.columns.values]
+    pivoted['Entry Date_avg'] = pd.to_datetime(pivoted['Entry Date_avg'], format='%Y%m%d', errors='coerce')
+    return pivoted
+
+
+# Fill results down each student/subject within the academic year. Groups for Year 10 and 12
+# students also carry results across years, at most two rows on.
+def fill_down(df):
+    fill_cols = [c for c in df.columns if any(prefix in c for prefix in ["Result_", "Numeric result_", "Result pk_"])]
+    df = df.sort_values(['Student', 'Subject', 'Teacher a b or c', 'Academic year', 'Term']).reset_index(drop=True)
+    if not fill_cols or df.empty:
+        return df
+
+    df[fill_cols] = df.groupby(['Student', 'Subject', 'Academic year'], sort=False, observed=True)[fill_cols].ffill()
+
+    exam_years = df['Year Group'].isin(['10', '12']).groupby([df['Student'], df['Subject']], sort=False, observed=True).transform('any')
+    if exam_years.any():
+        carried = df.groupby(['Student', 'Subject'], sort=False, observed=True)[fill_cols].ffill(limit=2)
+        df.loc[exam_years.to_numpy(), fill_cols] = carried[exam_years.to_numpy()]
+    return df
+
+
+# Append every derived column whose inputs are present
+def add_delta_columns(df):
+    deltas = {
+        label: df[col1].to_numpy(dtype='float64') - df[col2].to_numpy(dtype='float64')
+        for col1, col2, label in delta_columns
+        if col1 in df.columns and col2 in df.columns
+    }
+    return pd.concat([df, pd.DataFrame(deltas, index=df.index)], axis=1)
+
+
+# Rename result columns and drop the ones the report card does not show
+def finalise_columns(df):
+    df_renamed = df.rename(columns=column_mapping)
+    drop_cols = [c for c in df_renamed.columns if 'Mock score' in c or 'Commendation' in c]
+    return df_renamed.drop(columns=drop_cols)
+
+
+# Full report card build from fact_report rows and student versions already attached by the caller
+def build_report_card(merged):
+    return finalise_columns(add_delta_columns(fill_down(merged)))
@@ -0,0 +1,66 @@
+import argparse
+import math
+import multiprocessing
+import os
+import threading
+from functools import partial
+
+import numpy as np
+from warehouse_db import is_embedded
+
+# Person BKs are handed out in one block per school, so every stage can tell a person's school
+# (and so a teacher's classes, a student's enrolments...) from the BK alone.
+person_bk_block = 1_000_000
+
+
+def add_scale_arguments(parser):
+    parser.add_argument("--scale-factor", type=float, default=1.0,
+                        help="size of the generated warehouse; 1 is one school of the default size, "
+                             "N above 1 gives N schools")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes to generate schools in parallel")
+    return parser
+
+
+def parse_scale_args(description=None):
+    return add_scale_arguments(argparse.ArgumentParser(description=description)).parse_args()
+
+
+# Below 1 the single school shrinks; above 1 the data is spread over ceil(SF) schools
+def school_count(scale_factor):
+    return max(1, math.ceil(scale_factor))
+
+
+# How many of something one school gets at this scale factor
+def per_school(n, scale_factor):
+    return max(1, round(n * scale_factor / school_count(scale_factor)))
+
+
+def school_bk_range(school):
+    return school * person_bk_block, (school + 1) * person_bk_block - 1
+
+
+def school_of(person_bks):
+    return np.asarray(person_bks) // person_bk_block
+
+
+# Run fn(school, scale_factor) for every school. Each worker reads, generates and writes its own
+# school, so memory is bounded by one partition. Engines inherited over fork are disposed first.
+# SQLite and DuckDB files take one writing process at a time, and their open connections must not cross
+# a fork, so embedded databases run in-process.
+# A fork while other threads run can copy a lock one of them holds into a worker that then waits on it
+# forever, so with other threads alive the workers are spawned instead; fn must then be importable by
+# name, and each worker imports warehouse_db and opens its own engine.
+def run_partitioned(fn, scale_factor, workers=1, engine=None):
+    schools = range(school_count(scale_factor))
+    task = partial(fn, scale_factor=scale_factor)
+    if engine is not None and is_embedded(engine):
+        workers = 1
+    if workers <= 1 or len(schools) == 1:
+        return [task(school) for school in schools]
+
+    forking = "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+    ctx = multiprocessing.get_context("fork" if forking else "spawn")
+    initializer, initargs = (engine.dispose, (False,)) if forking and engine is not None else (None, ())
+    with ctx.Pool(min(workers, len(schools)), initializer=initializer, initargs=initargs) as pool:
+        return pool.map(task, schools)
@@ -0,0 +1,145 @@
+import datetime
+import pandas as pd
+from sqlalchemy import text
+from bulk_loader import insert_chunk
+from reference_cache import quote
+from source_reader import read_frame
+from warehouse_db import engine as default_engine
+
+# Slowly changing dimensions kept as type 2 history: the business key, the surrogate key, the validity
+# columns and the attributes whose change starts a new version
+dimensions = {
+    "dim Staff": {
+        "key": "Warehouse PK", "surrogate": "pk",
+        "effective": "Row effective date", "expiry": "Row expiry date",
+        "tracked": ["SIMS pk", "Title", "First name", "Last name", "Staff code", "Full name", "Email address",
+                    "FAM email address"],
+    },
+    "dim_students_isams": {
+        "key": "Person BK", "surrogate": "id",
+        "effective": "Row Effective Date", "expiry": "Row Expiration Date",
+        "tracked": ["First Name", "Last name", "Student Email", "Preferred first name", "FAM email", "GIS ID Number",
+                    "Gender", "Date of Birth", "Parent Salutation", "House", "Year Group", "Tutor Group", "EAL Status",
+                    "SEN Status", "SEN Profile URL", "Exam candidate number", "Nationality", "Ethnicity",
+                    "GIS Join Date", "GIS Leave Date", "ISAMS PK", "On Roll", "UCAS Personal id",
+                    "Reason for leaving", "Destination after leaving", "Destination institution",
+                    "Graduation academic year"],
+    },
+}
+
+
+# Tracked values as strings, so rows read back from the database hash like the rows generated in
+# memory: whole floats lose their ".0" and missing values all look the same
+def normalised(frame):
+    columns = {}
+    for name in frame.columns:
+        values = frame[name]
+        if pd.api.types.is_float_dtype(values):
+            present = values.dropna()
+            if (present == present.round()).all():
+                values = values.astype("Int64")
+        columns[name] = values.astype("string").fillna("\x00")
+    return pd.DataFrame(columns, index=frame.index)
+
+
+# One 64-bit hash of the tracked attributes per row, nullable so a left join cannot turn it into a float
+def row_hashes(frame, tracked):
+    hashes = pd.util.hash_pandas_object(normalised(frame[tracked]), index=False).to_numpy()
+    return pd.array(hashes.view("int64"), dtype="Int64")
+
+
+# Current version of every key in scope: not expired on the as-of date, latest effective first
+def current_versions(engine, table, spec, as_of, where=None, params=None):
+    expiry = quote(engine, spec["expiry"])
+    clause = f"({expiry} IS NULL OR {expiry} > :as_of)" + (f" AND ({where})" if where else "")
+    columns = [spec["surrogate"], spec["key"], spec["effective"]] + spec["tracked"]
+    current = read_frame(table, columns, where=clause, params={"as_of": as_of, **(params or {})}, engine=engine)
+    return current.sort_values([spec["key"], spec["effective"]], ascending=[True, False], na_position="last")
+
+
+# Last expiry of every key in scope that has expired versions, as a Series indexed by key. A key with
+# no current version but some history has to start its next version after that history ends.
+def history_ends(engine, table, spec, as_of, where=None, params=None):
+    key, expiry = quote(engine, spec["key"]), quote(engine, spec["expiry"])
+    clause = f"{expiry} IS NOT NULL AND {expiry} <= :as_of" + (f" AND ({where})" if where else "")
+    sql = text(f"SELECT {key}, MAX({expiry}) AS last_expiry FROM {quote(engine, table)} WHERE {clause} GROUP BY {key}")
+    ends = pd.read_sql(sql, engine, params={"as_of": as_of, **(params or {})})
+    return pd.Series(pd.to_datetime(ends["last_expiry"], errors="coerce").to_numpy(), index=ends[spec["key"]])
+
+
+# Run `sql` for batches of surrogate keys, bound as :s0, :s1... and listed in {ids}
+def for_surrogates(conn, sql, surrogates, params=None, batch=1000):
+    for start in range(0, len(surrogates), batch):
+        ids = [int(s) for s in surrogates[start:start + batch]]
+        names = [f"s{i}" for i in range(len(ids))]
+        conn.execute(text(sql.format(ids=", ".join(":" + n for n in names))), {**(params or {}), **dict(zip(names, ids))})
+
+
+def expire(conn, table, spec, surrogates, expiry_date):
+    for_surrogates(conn, f"UPDATE {quote(conn, table)} SET {quote(conn, spec['expiry'])} = :expiry "
+                         f"WHERE {quote(conn, spec['surrogate'])} IN ({{ids}})", surrogates, {"expiry": expiry_date})
+
+
+def delete(conn, table, spec, surrogates):
+    for_surrogates(conn, f"DELETE FROM {quote(conn, table)} WHERE {quote(conn, spec['surrogate'])} IN ({{ids}})",
+                   surrogates)
+
+
+# Merge a full extract of a dimension (or of the part of it matching `where`) as type 2 history.
+# New keys are inserted, from their extract's effective date or, for keys whose earlier versions have all
+# expired, from the day after the last of them; keys whose tracked attributes changed have their current row expired the day
+# before `as_of` and a new version inserted from `as_of`; unchanged keys are not written at all.
+# With expire_missing, current keys absent from the extract are expired as well.
+def scd2_merge(table, incoming, as_of=None, where=None, params=None, expire_missing=False, engine=default_engine):
+    spec = dimensions[table]
+    key, effective, expiry = spec["key"], spec["effective"], spec["expiry"]
+    as_of = as_of or datetime.date.today()
+    if incoming[key].duplicated().any():
+        raise ValueError(f"{table} extract has more than one row for some {key} values")
+
+    current = current_versions(engine, table, spec, as_of, where, params)
+    latest = current.drop_duplicates(key)
+    compared = incoming[[key]].assign(_hash=row_hashes(incoming, spec["tracked"])).merge(
+        latest[[key]].assign(_current_hash=row_hashes(latest, spec["tracked"])), on=key, how="left"
+    )
+    is_new = compared["_current_hash"].isna().to_numpy()
+    is_changed = ~is_new & (compared["_hash"] != compared["_current_hash"]).fillna(True).to_numpy(dtype=bool)
+
+    # Changed keys lose their current rows, and so does any older row still open beside a key's latest.
+    # A version that only started on the as-of date is replaced rather than left with an empty interval.
+    overlapping = current.index.difference(latest.index)
+    superseded = current[current[key].isin(incoming.loc[is_changed, key]) | current.index.isin(overlapping)]
+    starts_today = (pd.to_datetime(superseded[effective], errors="coerce") >= pd.Timestamp(as_of)).to_numpy()
+    to_delete = superseded.loc[starts_today, spec["surrogate"]].tolist()
+    to_expire = superseded.loc[~starts_today, spec["surrogate"]].tolist()
+    if expire_missing:
+        to_expire += current.loc[~current[key].isin(incoming[key]), spec["surrogate"]].tolist()
+
+    new_rows = incoming[is_new].copy()
+    if effective in new_rows:
+        new_rows[effective] = new_rows[effective].where(new_rows[effective].notna(), as_of)
+    else:
+        new_rows[effective] = as_of
+    # Keys coming back after their last version expired start the day after it, never inside it
+    resumes = new_rows[key].map(history_ends(engine, table, spec, as_of, where, params)) + pd.Timedelta(days=1)
+    starts = pd.to_datetime(new_rows[effective], errors="coerce")
+    overlaps = (resumes > starts).to_numpy(dtype=bool)
+    new_rows.loc[overlaps, effective] = resumes[overlaps].dt.date
+    versions = incoming[is_changed].copy()
+    versions[effective] = as_of
+    versions[expiry] = None
+    to_insert = pd.concat([new_rows, versions], ignore_index=True).drop(columns=[spec["surrogate"]], errors="ignore")
+
+    # Expiries and new versions commit together, so a key never has zero or two current rows
+    with engine.begin() as conn:
+        expire(conn, table, spec, to_expire, as_of - datetime.timedelta(days=1))
+        delete(conn, table, spec, to_delete)
+        if not to_insert.empty:
+            insert_chunk(conn, table, to_insert)
+
+    stats = {"inserted": int(is_new.sum()), "changed": int(is_changed.sum()),
+             "unchanged": int(len(incoming) - is_new.sum() - is_changed.sum()), "expired": len(to_expire),
+             "replaced": len(to_delete)}
+    print(f"{table}: {stats['inserted']} new, {stats['changed']} changed, {stats['unchanged']} unchanged, "
+          f"{stats['expired']} rows expired, {stats['replaced']} replaced")
+    return stats
@@ -0,0 +1,363 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+import pandas as pd
+import sqlalchemy
+from bulk_loader import load_chunks, iter_frame_chunks
+from reference_cache import quote
+from source_reader import read_frame
+from warehouse_db import engine, case_folded_tables, is_embedded
+
+# Seeds a fresh warehouse from Initial database.sql. Instead of replaying the dump as one serial
+# stream, it is split by table and the tables are restored at the same time over several connections,
+# with unique and foreign key checks off and secondary indexes added once each table is full.
+# A Parquet snapshot of the restored tables reloads without parsing any SQL.
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+dump_file = os.path.join(repo_dir, "Initial database.sql")
+snapshot_dir = os.environ.get("WAREHOUSE_SNAPSHOT_DIR", os.path.join(repo_dir, ".cache", "seed_snapshot"))
+manifest_name = "_manifest.json"
+
+# Session settings for the restoring connections, and what they go back to before returning to the pool
+load_settings = [
+    "SET NAMES utf8mb4",
+    "SET unique_checks = 0, foreign_key_checks = 0",
+    "SET sql_mode = 'NO_AUTO_VALUE_ON_ZERO'",
+]
+reset_settings = [
+    "SET unique_checks = 1, foreign_key_checks = 1",
+    "SET sql_mode = @@GLOBAL.sql_mode",
+]
+
+# Table definitions that can wait until the rows are in: every key but the primary key
+secondary_key = re.compile(r"(UNIQUE KEY|KEY|FULLTEXT KEY|SPATIAL KEY|CONSTRAINT)\b")
+table_statement = re.compile(r"(CREATE TABLE|INSERT INTO) `([^`]+)`")
+
+
+# Statements of a mysqldump file, one string each. Dumps escape newlines inside values, so a line
+# ending in ';' always ends a statement.
+def dump_statements(path):
+    statement = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not statement and (not line.strip() or line.startswith("--")
+                                  or (line.startswith("/*") and line.rstrip().endswith("*/"))):
+                continue
+            statement.append(line)
+            if line.rstrip().endswith(";"):
+                yield "".join(statement).strip().rstrip(";")
+                statement = []
+
+
+# CREATE TABLE and INSERT statements per table, in dump order. Session settings, locks and the
+# dump's own DISABLE KEYS are left out; the restore sets its own.
+def split_dump(path=dump_file):
+    tables = {}
+    for sql in dump_statements(path):
+        match = table_statement.match(sql)
+        if not match:
+            continue
+        kind, name = match.groups()
+        table = tables.setdefault(name, {"create": None, "inserts": []})
+        if kind == "CREATE TABLE":
+            table["create"] = sql
+        else:
+            table["inserts"].append(sql)
+    return tables
+
+
+# A CREATE TABLE without its secondary keys, and those keys as ALTER TABLE ... ADD clauses
+def split_indexes(create):
+    head, rest = create.split("\n", 1)
+    body, tail = rest.rsplit("\n", 1)
+    definitions = [line.strip().rstrip(",") for line in body.split("\n") if line.strip()]
+    kept = [d for d in definitions if not secondary_key.match(d)]
+    deferred = [d for d in definitions if secondary_key.match(d)]
+    return head + "\n  " + ",\n  ".join(kept) + "\n" + tail, deferred
+
+
+def dump_signature(path=dump_file):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# A connection with the load settings applied, reset before it goes back to the pool. No parameters
+# are ever bound, so '%' in the dumped values is not taken for a placeholder.
+@contextmanager
+def loading_connection(engine):
+    with engine.connect() as conn:
+        conn.execution_options(no_parameters=True)
+        try:
+            for sql in load_settings:
+                conn.exec_driver_sql(sql)
+            yield conn
+        finally:
+            for sql in reset_settings:
+                conn.exec_driver_sql(sql)
+            conn.commit()
+
+
+# Recreate every table without its secondary keys. Returns the keys held back for each table.
+def create_tables(engine, creates):
+    indexes = {}
+    with loading_connection(engine) as conn:
+        for name, create in creates.items():
+            create, indexes[name] = split_indexes(create)
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(conn, name)}")
+            conn.exec_driver_sql(create)
+        conn.commit()
+    return indexes
+
+
+# SQLite and DuckDB cannot run the dump's DDL or its MariaDB string escapes, so for them each CREATE TABLE
+# becomes a SQLAlchemy table and the INSERT values are parsed and bound as parameters
+column_definition = re.compile(r"`([^`]+)` (\w+)(?:\((\d+)\))?(.*)")
+key_definition = re.compile(r"(UNIQUE )?KEY `([^`]+)` \((.*)\)")
+auto_increment = re.compile(r"AUTO_INCREMENT=(\d+)")
+dump_value = re.compile(r"'((?:[^'\\]|\\.)*)'|(NULL)|([-+0-9.eE]+)")
+dump_escape = re.compile(r"\\(.)")
+dump_escapes = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+column_types = {
+    "tinyint": sqlalchemy.SmallInteger, "smallint": sqlalchemy.SmallInteger, "int": sqlalchemy.Integer,
+    "bigint": sqlalchemy.BigInteger, "float": sqlalchemy.Float, "double": sqlalchemy.Float,
+    "char": sqlalchemy.String, "varchar": sqlalchemy.String, "text": sqlalchemy.Text,
+    "date": sqlalchemy.Date, "datetime": sqlalchemy.DateTime, "time": sqlalchemy.Time,
+}
+# Dumped strings as the Python values the column types bind
+value_parsers = {
+    sqlalchemy.Date: datetime.date.fromisoformat,
+    sqlalchemy.DateTime: datetime.datetime.fromisoformat,
+    sqlalchemy.Time: datetime.time.fromisoformat,
+}
+
+
+# The table a CREATE TABLE describes, with its secondary keys as indexes that are not yet part of it.
+# AUTO_INCREMENT keys get a sequence on DuckDB, which has no auto-increment column type, starting after
+# the dumped rows.
+def embedded_table(engine, name, create):
+    metadata = sqlalchemy.MetaData()
+    stored = case_folded_tables.get(name, name)
+    start = int(auto_increment.search(create.rsplit("\n", 1)[1]).group(1)) if "AUTO_INCREMENT=" in create else 1
+    primary = re.search(r"PRIMARY KEY \(([^)]*)\)", create)
+    primary = [c.strip("`") for c in primary.group(1).split(",")] if primary else []
+    columns, keys = [], []
+    for line in create.split("\n")[1:-1]:
+        line = line.strip().rstrip(",")
+        if line.startswith("`"):
+            column, kind, length, rest = column_definition.match(line).groups()
+            column_type = column_types[kind.lower()]
+            column_type = column_type(int(length)) if column_type is sqlalchemy.String and length else column_type()
+            default = re.search(r"DEFAULT ('[^']*'|\d+)", rest)
+            default = default.group(1) if default else None
+            extra = []
+            if "AUTO_INCREMENT" in rest and engine.dialect.name == "duckdb":
+                sequence = f"{stored}_{column}_seq".replace(" ", "_")
+                extra, default = [sqlalchemy.Sequence(sequence, start=start)], f"nextval('{sequence}')"
+            columns.append(sqlalchemy.Column(
+                column, column_type, *extra, primary_key=column in primary, nullable="NOT NULL" not in rest,
+                autoincrement="AUTO_INCREMENT" in rest,
+                server_default=sqlalchemy.text(default) if default else None,
+            ))
+        elif key_definition.match(line):
+            keys.append(key_definition.match(line).groups())
+    table = sqlalchemy.Table(name, metadata, *columns)
+    # Index names are per table in MariaDB but per database, and case-insensitive, here
+    indexes = [sqlalchemy.Index(f"{stored}_{key}".replace(" ", "_"),
+                                *[table.c[c.strip("`")] for c in key_columns.split(",")], unique=bool(unique))
+               for unique, key, key_columns in keys]
+    return table, indexes
+
+
+# Rows of a dumped multi-row INSERT as tuples of Python values, MariaDB escapes undone
+def dump_rows(sql, table):
+    parsers = [value_parsers.get(type(c.type)) for c in table.columns]
+    head, values = sql.split("\n", 1)
+    rows = []
+    for row in values[1:-1].split("),\n("):
+        parsed = []
+        for (string, null, number), parse in zip(dump_value.findall(row), parsers):
+            if null:
+                parsed.append(None)
+            elif number:
+                parsed.append(float(number) if any(c in number for c in ".eE") else int(number))
+            else:
+                string = dump_escape.sub(lambda m: dump_escapes.get(m.group(1), m.group(1)), string)
+                parsed.append(parse(string) if parse else string)
+        rows.append(dict(zip(table.columns.keys(), parsed)))
+    return rows
+
+
+def create_embedded_tables(engine, creates):
+    indexes = {}
+    with engine.connect() as conn:
+        for name, create in creates.items():
+            table, indexes[name] = embedded_table(engine, name, create)
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(conn, name)}")
+            for column in table.columns:
+                if isinstance(column.default, sqlalchemy.Sequence):
+                    conn.exec_driver_sql(f"DROP SEQUENCE IF EXISTS {quote(conn, column.default.name)}")
+                    conn.execute(sqlalchemy.schema.CreateSequence(column.default))
+            # CreateTable rather than table.create, which would build the indexes before the rows are in
+            conn.execute(sqlalchemy.schema.CreateTable(table))
+        conn.commit()
+    return indexes
+
+
+def run_embedded_insert(engine, table, sql):
+    rows = dump_rows(sql, table)
+    with engine.connect() as conn:
+        conn.execute(table.insert(), rows)
+        conn.commit()
+    return len(rows)
+
+
+def add_embedded_indexes(engine, indexes):
+    with engine.connect() as conn:
+        for index in indexes:
+            index.create(conn)
+        conn.commit()
+    return len(indexes)
+
+
+# A multi-row INSERT as several smaller ones that can run on different connections. Rows are one per
+# line in a dump, so "),\n(" only ever separates two rows.
+def insert_batches(sql, rows_per_batch=2000):
+    head, values = sql.split("\n", 1)
+    rows = values[1:-1].split("),\n(")
+    for start in range(0, len(rows), rows_per_batch):
+        yield f"{head}\n(" + "),\n(".join(rows[start:start + rows_per_batch]) + ")"
+
+
+def run_insert(engine, sql):
+    with loading_connection(engine) as conn:
+        rows = conn.exec_driver_sql(sql).rowcount
+        conn.commit()
+    return rows
+
+
+# All of a table's secondary keys in one ALTER TABLE, so each is built once from the loaded rows
+def add_indexes(engine, name, indexes):
+    if indexes:
+        with loading_connection(engine) as conn:
+            conn.exec_driver_sql(f"ALTER TABLE {quote(conn, name)} " + ", ".join(f"ADD {d}" for d in indexes))
+    return len(indexes)
+
+
+# Run (table, size, fn) tasks over `workers` connections, biggest first so a large piece does not
+# start last. Returns rows loaded per table.
+def run_tasks(tasks, workers):
+    rows = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fn): table for table, size, fn in sorted(tasks, key=lambda t: t[1], reverse=True)}
+        for future in as_completed(futures):
+            rows[futures[future]] = rows.get(futures[future], 0) + (future.result() or 0)
+    return rows
+
+
+# Row batches of the dump's INSERT statements
+def dump_tasks(engine, tables):
+    if is_embedded(engine):
+        targets = {name: embedded_table(engine, name, table["create"])[0] for name, table in tables.items()}
+        return [(name, len(batch), partial(run_embedded_insert, engine, targets[name], batch))
+                for name, table in tables.items() for sql in table["inserts"] for batch in insert_batches(sql)]
+    return [(name, len(batch), partial(run_insert, engine, batch))
+            for name, table in tables.items() for sql in table["inserts"] for batch in insert_batches(sql)]
+
+
+# Slices of each table's Parquet file; load_chunks takes its own connection for each, and no writer
+# threads of its own as the slices already load side by side
+def snapshot_tasks(engine, entries, directory, workers):
+    tasks = []
+    for name, entry in entries.items():
+        frame = pd.read_parquet(os.path.join(directory, entry["file"]))
+        step = max(50_000, -(-len(frame) // workers))
+        for start in range(0, len(frame), step):
+            piece = frame.iloc[start:start + step]
+            tasks.append((name, len(piece), partial(load_chunks, engine, name, iter_frame_chunks(piece), writers=0)))
+    return tasks
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, manifest_name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# Parquet file per table plus a manifest with each table's CREATE TABLE and the dump it came from.
+# Integer columns are read as nullable integers so NULLs do not turn them into floats.
+def write_snapshot(engine, tables, directory=snapshot_dir, dump_path=dump_file):
+    os.makedirs(directory, exist_ok=True)
+    inspector = sqlalchemy.inspect(engine)
+    manifest = {"dump": dump_signature(dump_path), "tables": {}}
+    for name, table in tables.items():
+        columns = inspector.get_columns(name)
+        dtypes = {c["name"]: "Int64" for c in columns if isinstance(c["type"], sqlalchemy.Integer)}
+        frame = read_frame(name, [c["name"] for c in columns], dtypes=dtypes, engine=engine)
+        file = f"{name.replace(' ', '_')}.parquet"
+        frame.to_parquet(os.path.join(directory, file), index=False)
+        manifest["tables"][name] = {"file": file, "rows": len(frame), "create": table["create"]}
+    with open(os.path.join(directory, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote a snapshot of {len(tables)} tables to {directory}")
+    return manifest
+
+
+# Restore every table of the dump (or just `only`), from the snapshot when asked for and it was taken
+# from this dump, otherwise from the SQL. Tables are created first, then their rows are loaded in
+# pieces over `workers` connections, then the secondary keys are built, a table per connection.
+# SQLite takes one writer at a time, so it is seeded over a single connection.
+def seed(engine=engine, dump_path=dump_file, workers=4, from_snapshot=False, directory=snapshot_dir, only=None):
+    if engine.dialect.name == "sqlite":
+        workers = 1
+    create = create_embedded_tables if is_embedded(engine) else create_tables
+    started = time.perf_counter()
+    manifest = read_manifest(directory) if from_snapshot else None
+    if from_snapshot and (manifest is None or manifest["dump"] != dump_signature(dump_path)):
+        print(f"No snapshot of {os.path.basename(dump_path)} in {directory}; restoring from the SQL instead.")
+        manifest = None
+
+    if manifest is not None:
+        entries = {n: e for n, e in manifest["tables"].items() if not only or n in only}
+        indexes = create(engine, {n: e["create"] for n, e in entries.items()})
+        rows = run_tasks(snapshot_tasks(engine, entries, directory, workers), workers)
+    else:
+        tables = {n: t for n, t in split_dump(dump_path).items() if not only or n in only}
+        indexes = create(engine, {n: t["create"] for n, t in tables.items()})
+        rows = run_tasks(dump_tasks(engine, tables), workers)
+    loaded = time.perf_counter()
+    if is_embedded(engine):
+        run_tasks([(n, len(i), partial(add_embedded_indexes, engine, i)) for n, i in indexes.items() if i], workers)
+    else:
+        run_tasks([(n, len(i), partial(add_indexes, engine, n, i)) for n, i in indexes.items() if i], workers)
+
+    for name in indexes:
+        print(f"  {name}: {rows.get(name, 0)} rows, {len(indexes[name])} secondary keys")
+    print(f"Seeded {len(indexes)} tables, {sum(rows.values())} rows from the "
+          f"{'snapshot' if manifest is not None else 'dump'} in {time.perf_counter() - started:.1f}s "
+          f"({time.perf_counter() - loaded:.1f}s building indexes)")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restore the warehouse from Initial database.sql in parallel")
+    parser.add_argument("--dump", default=dump_file, help="mysqldump file to restore")
+    parser.add_argument("--workers", type=int, default=4, help="tables to restore at the same time")
+    parser.add_argument("--tables", nargs="+", help="only restore these tables")
+    parser.add_argument("--from-snapshot", action="store_true",
+                        help="reload the Parquet snapshot instead of the SQL, if it was taken from this dump")
+    parser.add_argument("--write-snapshot", action="store_true", help="write a Parquet snapshot after restoring")
+    parser.add_argument("--snapshot-dir", default=snapshot_dir, help="where the snapshot is kept")
+    args = parser.parse_args()
+    seed(engine, args.dump, args.workers, args.from_snapshot, args.snapshot_dir, args.tables)
+    if args.write_snapshot:
+        tables = split_dump(args.dump)
+        write_snapshot(engine, {n: t for n, t in tables.items() if not args.tables or n in args.tables},
+                       args.snapshot_dir, args.dump)
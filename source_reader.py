@@ -0,0 +1,49 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sqlalchemy import text
+from reference_cache import quote
+from warehouse_db import engine as default_engine
+
+# Reads for the big source tables. A plain pd.read_sql has PyMySQL buffer the whole result on the client
+# before pandas copies it again; with stream_results SQLAlchemy uses an unbuffered SSCursor instead,
+# so only one chunk of rows is held at a time.
+default_chunk_size = 100_000
+
+
+def select_sql(engine, table, columns, where=None, order_by=None):
+    sql = f"SELECT {', '.join(quote(engine, c) for c in columns)} FROM {quote(engine, table)}"
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += f" ORDER BY {', '.join(quote(engine, c) for c in order_by)}"
+    return text(sql)
+
+
+# Yield DataFrames of at most chunk_size rows with only `columns`, cast to `dtypes` as each chunk is
+# parsed, e.g. {"Student": "int32", "Subject": "category"}. The connection stays open (and busy)
+# until the generator is exhausted or closed.
+def read_chunks(table, columns, where=None, params=None, dtypes=None, order_by=None,
+                chunk_size=default_chunk_size, engine=default_engine):
+    sql = select_sql(engine, table, columns, where, order_by)
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+        yield from pd.read_sql(sql, conn, params=params, chunksize=chunk_size, dtype=dtypes)
+
+
+# Stitch chunks into one frame. Each chunk gets its own categories, which pd.concat would turn back
+# into object columns, so categoricals are unified first.
+def concat_chunks(chunks):
+    chunks = list(chunks)
+    if len(chunks) == 1:
+        return chunks[0]
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([c[col] for c in chunks], sort_categories=True).categories
+            for c in chunks:
+                c[col] = c[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+# The whole result as one compact frame, without the client-side copy of the raw rows
+def read_frame(table, columns, where=None, params=None, dtypes=None, order_by=None,
+               chunk_size=default_chunk_size, engine=default_engine):
+    return concat_chunks(read_chunks(table, columns, where, params, dtypes, order_by, chunk_size, engine))
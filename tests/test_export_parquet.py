@@ -0,0 +1,33 @@
+import datetime
+import os
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from export_parquet import arrow_schema, to_arrow  # noqa: E402
+from warehouse_db import create_warehouse_engine  # noqa: E402
+
+
+def test_time_column_round_trips(tmp_path):
+    engine = create_warehouse_engine(f"sqlite:///{tmp_path / 'warehouse.sqlite'}", pool_size=1)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text('CREATE TABLE "fact Attendance" ("Date pk" INTEGER, "Time recorded" TIME)'))
+    schema = arrow_schema(engine, "fact Attendance")
+    engine.dispose()
+    assert schema.field("Time recorded").type == pa.time64("us")
+
+    # The MariaDB driver returns TIME as timedelta; the embedded backends as time objects or strings
+    chunks = [
+        pd.DataFrame({"Date pk": [1, 2], "Time recorded": [datetime.timedelta(hours=8, minutes=30), None]}),
+        pd.DataFrame({"Date pk": [3, 4], "Time recorded": [datetime.time(13, 5, 7), "09:15:00"]}),
+    ]
+    path = tmp_path / "attendance.parquet"
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(to_arrow(chunk, schema))
+
+    times = pq.read_table(path).column("Time recorded").to_pylist()
+    assert times == [datetime.time(8, 30), None, datetime.time(13, 5, 7), datetime.time(9, 15)]
@@ -0,0 +1,34 @@
+import os
+import sys
+from functools import partial
+import pytest
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from scale import run_partitioned  # noqa: E402
+from warehouse_db import create_warehouse_engine  # noqa: E402
+
+pytest.importorskip("duckdb_engine")
+
+
+# One school's partition: its own engine on the shared file, as a generator script would open
+def write_school(school, scale_factor, url):
+    engine = create_warehouse_engine(url, pool_size=1)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("INSERT INTO schools VALUES (:school)"), {"school": school})
+    engine.dispose()
+    return 1
+
+
+def test_duckdb_partitions_run_in_one_process(tmp_path):
+    url = f"duckdb:///{tmp_path / 'warehouse.duckdb'}"
+    engine = create_warehouse_engine(url, pool_size=1)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE schools (school INTEGER)"))
+
+    # Two schools and two workers; a second process could not lock the file
+    assert run_partitioned(partial(write_school, url=url), 2.0, workers=2, engine=engine) == [1, 1]
+    with engine.connect() as conn:
+        assert conn.execute(sqlalchemy.text("SELECT school FROM schools ORDER BY school")).scalars().all() == [0, 1]
+    engine.dispose()
+
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Periods that are tutor registration rather than taught lessons
+registration_periods = {"AM Reg", "PM Reg"}
+
+
+# Flatten the week structure into an ordered list of (day, period) lesson slots
+def weekly_slots(week_structure):
+    return [
+        (day, period)
+        for day, periods in week_structure.items()
+        for period in periods
+        if period not in registration_periods
+    ]
+
+
+# Give every teaching group up to lessons_per_week slots so that no student is timetabled twice at once.
+# Each student's busy slots are held as a bitmask, so the clash check for a class is one OR-reduce.
+def build_weekly_timetable(enrolments, week_structure, lessons_per_week=2, seed=42, student_col="Student pk"):
+    rng = np.random.default_rng(seed)
+    slots = weekly_slots(week_structure)
+    if len(slots) > 64:
+        raise ValueError("week_structure has more than 64 lesson slots")
+
+    student_codes, student_index = np.unique(enrolments[student_col].to_numpy(), return_inverse=True)
+    group_codes, group_index = np.unique(enrolments["Teaching group ID"].to_numpy(), return_inverse=True)
+    busy = np.zeros(len(student_codes), dtype=np.uint64)
+
+    # Sort once so each group's students are a contiguous slice
+    order = np.argsort(group_index, kind="stable")
+    bounds = np.searchsorted(group_index[order], np.arange(len(group_codes) + 1))
+    sizes = np.diff(bounds)
+
+    slot_bits = np.left_shift(np.uint64(1), np.arange(len(slots), dtype=np.uint64))
+    timetable = []
+
+    # Place the largest groups first; they are the hardest to fit
+    for g in np.argsort(-sizes, kind="stable"):
+        members = student_index[order[bounds[g]:bounds[g + 1]]]
+        taken = np.bitwise_or.reduce(busy[members]) if len(members) else np.uint64(0)
+        free = np.flatnonzero((taken & slot_bits) == 0)
+        if not len(free):
+            continue
+
+        chosen = rng.choice(free, size=min(lessons_per_week, len(free)), replace=False)
+        busy[members] |= np.bitwise_or.reduce(slot_bits[chosen])
+        for s in chosen:
+            timetable.append((group_codes[g], slots[s][0], slots[s][1]))
+
+    return pd.DataFrame(timetable, columns=["Teaching group ID", "Day name", "Period"])
+
+
+# Repeat the weekly timetable onto every school day and every enrolled student
+def expand_timetable(timetable, enrolments, dates_df):
+    lessons = dates_df.merge(timetable, on="Day name")
+    lessons = lessons.sort_values(["Teaching group ID", "Date pk", "Period"], kind="stable").reset_index(drop=True)
+
+    members = enrolments.sort_values("Teaching group ID", kind="stable").reset_index(drop=True)
+    group_ids = members["Teaching group ID"].to_numpy()
+
+    # For each lesson, the slice of members belonging to its group
+    start = np.searchsorted(group_ids, lessons["Teaching group ID"].to_numpy(), side="left")
+    stop = np.searchsorted(group_ids, lessons["Teaching group ID"].to_numpy(), side="right")
+    counts = stop - start
+
+    lesson_index = np.repeat(np.arange(len(lessons)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    member_index = np.repeat(start, counts) + offsets
+
+    registers = lessons.iloc[lesson_index].reset_index(drop=True)
+    for col in members.columns:
+        if col != "Teaching group ID":
+            registers[col] = members[col].to_numpy()[member_index]
+    return registers
+
+
+# Expand a block of school days at a time so callers can stream the registers
+def iter_registers(timetable, enrolments, dates_df, days_per_chunk=10):
+    for start in range(0, len(dates_df), days_per_chunk):
+        yield expand_timetable(timetable, enrolments, dates_df.iloc[start:start + days_per_chunk])
@@ -0,0 +1,66 @@
+import datetime
+import sqlalchemy
+from sqlalchemy import text
+
+# Columns added to fact_update_history so incremental jobs can record how far they have read
+high_water_columns = {
+    "high_water_source": "VARCHAR(64)",
+    "high_water_pk": "BIGINT",
+}
+
+
+def quote(engine, name):
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+# Add any missing high-water or flag columns to an existing fact_update_history
+def ensure_update_history_columns(engine, extra_flags=()):
+    existing = {c["name"].lower() for c in sqlalchemy.inspect(engine).get_columns("fact_update_history")}
+    wanted = dict(high_water_columns)
+    # DuckDB cannot add a column with a constraint, so there the flag is only defaulted
+    flag_ddl = "VARCHAR(3) DEFAULT 'No'" if engine.dialect.name == "duckdb" else "VARCHAR(3) NOT NULL DEFAULT 'No'"
+    wanted.update({flag: flag_ddl for flag in extra_flags})
+    with engine.begin() as conn:
+        for name, ddl in wanted.items():
+            if name.lower() not in existing:
+                conn.execute(text(f"ALTER TABLE fact_update_history ADD COLUMN {quote(engine, name)} {ddl}"))
+
+
+# Last source pk a target table was refreshed up to, or None if it has never been refreshed incrementally
+def last_high_water(engine, target_flag, source_table):
+    ensure_update_history_columns(engine, [target_flag])
+    with engine.connect() as conn:
+        return conn.execute(text(f"""
+            SELECT MAX(high_water_pk) FROM fact_update_history
+            WHERE {quote(engine, target_flag)} = 'Yes' AND high_water_source = :source
+        """), {"source": source_table}).scalar()
+
+
+# Record that target_flag is up to date with source_table rows up to high_water_pk
+def record_high_water(conn, target_flag, source_table, high_water_pk):
+    now = datetime.datetime.now().replace(microsecond=0)
+    conn.execute(text(f"""
+        INSERT INTO fact_update_history (date, date_fk, time, {quote(conn, target_flag)}, high_water_source, high_water_pk)
+        VALUES (:date, :date_fk, :time, 'Yes', :source, :pk)
+    """), {
+        "date": now,
+        "date_fk": int(now.strftime("%Y%m%d")),
+        "time": now.time().isoformat(),
+        "source": source_table,
+        "pk": None if high_water_pk is None else int(high_water_pk),
+    })
+
+
+# Forget how far incremental jobs, or only the one of target_flag, have read source_table. A high-water
+# mark cannot see rows removed from the source, so after a delete the next refresh of every job reading
+# it rebuilds in full.
+def forget_high_water(conn, source_table, target_flag=None):
+    only = f" AND {quote(conn, target_flag)} = 'Yes'" if target_flag else ""
+    conn.execute(text(f"UPDATE fact_update_history SET high_water_pk = NULL WHERE high_water_source = :source{only}"),
+                 {"source": source_table})
+
+
+# Highest pk currently in a table
+def max_pk(engine, table, pk="pk"):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT MAX({quote(engine, pk)}) FROM {quote(engine, table)}")).scalar()
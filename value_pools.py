@@ -0,0 +1,67 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from faker import Faker
+
+# Faker costs far more per call than the rest of row generation, so text columns are drawn from
+# seeded pools built once per process and, by default, kept on disk between runs.
+pool_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "pools")
+pool_size = 5000
+_pools = {}
+
+
+def pool_path(kind, size, seed, kwargs):
+    args = "".join(f"_{k}{v}" for k, v in sorted(kwargs.items()))
+    return os.path.join(pool_dir, f"{kind}{args}_{size}_{seed}.json")
+
+
+# `size` values from one Faker provider, e.g. value_pool("sentence", nb_words=6)
+def value_pool(kind, size=pool_size, seed=42, cache=True, **kwargs):
+    key = (kind, size, seed, tuple(sorted(kwargs.items())))
+    if key in _pools:
+        return _pools[key]
+
+    path = pool_path(kind, size, seed, kwargs)
+    if cache and os.path.exists(path):
+        with open(path) as f:
+            values = json.load(f)
+    else:
+        fake = Faker()
+        fake.seed_instance(seed)
+        method = getattr(fake, kind)
+        values = [method(**kwargs) for _ in range(size)]
+        if cache:
+            os.makedirs(pool_dir, exist_ok=True)
+            with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+                json.dump(values, f)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    _pools[key] = np.array(values, dtype=object)
+    return _pools[key]
+
+
+# n values drawn with replacement
+def draw(pool, n, rng):
+    return pool[rng.integers(0, len(pool), n)]
+
+
+# Random version-4 UUID strings for a whole batch
+def uuid4_strings(n, rng):
+    raw = rng.integers(0, 256, (n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hexed = raw.tobytes().hex()
+    return [
+        f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+        for h in (hexed[k:k + 32] for k in range(0, len(hexed), 32))
+    ]
+
+
+# Make values unique by numbering repeats in order: smith.j, smith.j1, smith.j2...
+# Only safe for values that do not already end in digits.
+def number_duplicates(values):
+    values = pd.Series(values, dtype=object)
+    rank = values.groupby(values, sort=False).cumcount().to_numpy()
+    suffix = np.where(rank > 0, rank.astype(str), "")
+    return (values + suffix).to_numpy(dtype=object)
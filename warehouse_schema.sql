@@ -182,7 +182,9 @@ CREATE TABLE fact_attendance (
     class_teacher_warehouse_bk INT,
     sims_class_pk INT,
     sims_subject_pk INT,
-    INDEX idx_fact_attendance (pk, date_pk)
+    INDEX idx_fact_attendance (pk, date_pk),
+    INDEX idx_attendance_student_date (student_warehouse_bk, date_pk),
+    INDEX idx_attendance_group_date (teaching_group_pk, date_pk)
 );
 
 CREATE TABLE fact_behaviour (
@@ -206,7 +208,9 @@ CREATE TABLE fact_behaviour (
     isams_id CHAR(36),
     action_location VARCHAR(50),
     action_time VARCHAR(10),
-    action_date INT
+    action_date INT,
+    INDEX idx_behaviour_student_date (student, date_recorded),
+    INDEX idx_behaviour_teacher (recording_teacher)
 );
 
 CREATE TABLE fact_student_class_enrolment (
@@ -216,7 +220,9 @@ CREATE TABLE fact_student_class_enrolment (
     teaching_group_id INT NOT NULL,
     row_effective_date DATE NOT NULL,
     row_expiry_date DATE,
-    academic_year VARCHAR(50) NOT NULL
+    academic_year VARCHAR(50) NOT NULL,
+    INDEX idx_enrolment_year_student (academic_year, student_warehouse_bk),
+    INDEX idx_enrolment_group (teaching_group_id)
 );
 
 CREATE TABLE fact_update_history (
@@ -236,7 +242,9 @@ CREATE TABLE fact_update_history (
     fact_report VARCHAR(3) DEFAULT 'No' NOT NULL,
     fact_student_termly_report_card VARCHAR(3) DEFAULT 'No' NOT NULL,
     fact_achievement VARCHAR(3) DEFAULT 'No' NOT NULL,
-    fact_behaviour VARCHAR(3) DEFAULT 'No' NOT NULL
+    fact_behaviour VARCHAR(3) DEFAULT 'No' NOT NULL,
+    high_water_source VARCHAR(64),
+    high_water_pk BIGINT
 );
 
 CREATE TABLE fact_report (
@@ -253,7 +261,9 @@ CREATE TABLE fact_report (
     teaching_group_pk INT,
     numeric_result FLOAT,
     sims_aspect_name VARCHAR(50),
-    sims_result_set_name VARCHAR(55)
+    sims_result_set_name VARCHAR(55),
+    INDEX idx_report_year_student (academic_year, student, subject),
+    INDEX idx_report_group (teaching_group_pk)
 );
 
 CREATE TABLE fact_termly_report_card (